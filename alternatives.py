@@ -0,0 +1,200 @@
+import heapq
+import math
+
+import metrics
+from search import Route, shortest_path
+
+# Alternatives may cost at most this much more than the best route...
+MAX_STRETCH = 1.3
+# ...and share at most this fraction of their length with a better one
+MAX_OVERLAP = 0.6
+
+# Factor the penalty method multiplies the costs of already used edges by
+PENALTY = 1.5
+
+
+@metrics.timed('alternatives')
+def alternative_routes(graph, source, target, weight='length', k=3,
+                       max_overlap=MAX_OVERLAP, max_stretch=MAX_STRETCH,
+                       departure=0.0, method='plateau'):
+    """Up to ``k`` meaningfully different routes, best first.
+
+    ``method='plateau'`` grows one search tree from the source and one
+    backwards from the target, then builds routes through the chains of
+    edges both trees share (plateaus): every alternative comes out of the
+    same two searches. ``method='penalty'`` reruns A* with the edges of the
+    routes found so far made more expensive, which suits time-dependent
+    routing better because the plateau trees use fixed costs (those of the
+    bucket at ``departure``).
+
+    A route is kept when it costs at most ``max_stretch`` times the best
+    one and shares at most ``max_overlap`` of its length with every route
+    kept before it. The first route is the best one (by the fixed costs,
+    for plateaus over travel time); fewer than ``k`` come back when the
+    network offers no more.
+    """
+    if method == 'plateau':
+        candidates = _plateau_candidates(graph, source, target, weight,
+                                         departure, max_stretch)
+    elif method == 'penalty':
+        candidates = _penalty_candidates(graph, source, target, weight,
+                                         departure, k)
+    else:
+        raise ValueError(f"Unknown alternatives method: {method}")
+
+    chosen = []
+    best = None
+    for route in candidates:
+        cost = _route_cost(graph, route, weight, departure)
+        if best is None:
+            best = cost
+        elif cost > max_stretch * best:
+            continue
+        if all(_overlap(graph, route, other) <= max_overlap
+               for other in chosen):
+            chosen.append(Route(cost, route.nodes, route.edges))
+            if len(chosen) == k:
+                break
+    return chosen
+
+
+def _route_cost(graph, route, weight, departure):
+    """Exact cost of a route, time-dependent for travel_time"""
+    _, _, weights = graph.adjacency(weight)
+    if weight != 'travel_time':
+        return sum(weights[e] for e in route.edges)
+    clock = departure
+    for e in route.edges:
+        clock += weights[graph.bucket_at(clock)][e]
+    return clock - departure
+
+
+def _overlap(graph, route, other):
+    """Fraction of ``route``'s length on edges ``other`` also uses"""
+    length = graph.length[route.edges].sum()
+    if length == 0:
+        return 1.0
+    shared = list(set(route.edges) & set(other.edges))
+    return float(graph.length[shared].sum() / length)
+
+
+def _static_weights(graph, weight, departure):
+    _, _, weights = graph.adjacency(weight)
+    if weight == 'travel_time':
+        weights = weights[graph.bucket_at(departure)]
+    return weights
+
+
+def _tree(indptr, neighbours, edge_ids, weights, source, limit=math.inf,
+          target=None, stretch=1.0):
+    """Dijkstra costs and the edge each node was reached by, up to ``limit``.
+
+    ``edge_ids`` maps adjacency positions to edge ids (None when they are
+    the same, as in the forward CSR). Once ``target`` is settled the limit
+    drops to ``stretch`` times its cost.
+    """
+    dist = {source: 0.0}
+    parent_edge = {source: -1}
+    settled = set()
+    heap = [(0.0, source)]
+    while heap:
+        d, u = heapq.heappop(heap)
+        if u in settled:
+            continue
+        if d > limit:
+            break
+        if u == target:
+            limit = min(limit, d * stretch)
+        settled.add(u)
+        for p in range(indptr[u], indptr[u + 1]):
+            e = p if edge_ids is None else edge_ids[p]
+            v = neighbours[p]
+            nd = d + weights[e]
+            if nd < dist.get(v, math.inf):
+                dist[v] = nd
+                parent_edge[v] = e
+                heapq.heappush(heap, (nd, v))
+    return ({u: dist[u] for u in settled},
+            {u: parent_edge[u] for u in settled})
+
+
+def _plateau_candidates(graph, source, target, weight, departure,
+                        max_stretch):
+    """Routes through each plateau of the two trees.
+
+    The cheapest route comes first, as the one the others are measured
+    against; the rest follow longest plateau first.
+    """
+    if source == target:
+        # No plateaus, but the empty route is still the best one
+        return [Route(0.0, [source], [])]
+    weights = _static_weights(graph, weight, departure)
+    indptr, heads, _ = graph.adjacency(weight)
+    tails = graph.tails_list()
+    forward, to_node = _tree(indptr, heads, None, weights, source,
+                             target=target, stretch=max_stretch)
+    if target not in forward:
+        return []
+    limit = forward[target] * max_stretch
+    backward, from_node = _tree(*graph.reverse_adjacency(), weights, target,
+                                limit)
+
+    # An edge is on a plateau when it is the forward tree's way into its
+    # head and the backward tree's way out of its tail
+    plateau = {e for v, e in to_node.items()
+               if e >= 0 and from_node.get(tails[e]) == e}
+    chains = []
+    for e in plateau:
+        if to_node.get(tails[e]) in plateau:
+            continue  # not the first edge of its chain
+        end, length = heads[e], weights[e]
+        while from_node.get(end, -1) in plateau:
+            length += weights[from_node[end]]
+            end = heads[from_node[end]]
+        if forward[end] + backward[end] <= limit:
+            chains.append((length, end))
+    chains.sort(reverse=True)
+
+    routes = []
+    for _, via in chains:
+        edges = []
+        node = via
+        while node != source:
+            edges.append(to_node[node])
+            node = tails[to_node[node]]
+        edges.reverse()
+        node = via
+        while node != target:
+            edges.append(from_node[node])
+            node = heads[from_node[node]]
+        nodes = [source] + [heads[e] for e in edges]
+        if len(set(nodes)) == len(nodes):
+            routes.append(Route(forward[via] + backward[via], nodes, edges))
+    if routes:
+        best = min(range(len(routes)), key=lambda i: routes[i].cost)
+        routes.insert(0, routes.pop(best))
+    return routes
+
+
+def _penalty_candidates(graph, source, target, weight, departure, k):
+    """Routes from repeated A* runs, penalising the edges already used"""
+    _, _, weights = graph.adjacency(weight)
+    if weight == 'travel_time':
+        weights = [list(bucket) for bucket in weights]
+    else:
+        weights = list(weights)
+    used = set()
+    # A few extra runs, as some results repeat or overlap too much
+    for _ in range(k * 3):
+        route = shortest_path(graph, source, target, weight=weight,
+                              departure=departure, weights=weights)
+        if route is None:
+            return
+        yield route
+        new = set(route.edges) - used
+        if not new:
+            return
+        used |= new
+        for bucket in (weights if weight == 'travel_time' else [weights]):
+            for e in new:
+                bucket[e] *= PENALTY
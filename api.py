@@ -0,0 +1,160 @@
+"""Request parameters shared by app.py (Flask) and server.py (ASGI).
+
+Both services read their query strings and JSON bodies through these
+parsers, so they accept the same requests, apply the same limits and
+report the same errors. Anything wrong with a parameter raises BadRequest,
+which the services answer with 400.
+"""
+import math
+
+import trip
+from alternatives import MAX_OVERLAP, MAX_STRETCH
+from mapdata import RoutingEngine
+from speeds import parse_departure
+
+# Finer isochrone grids than this get large without looking any better,
+# and coarser ones no longer follow the streets
+MIN_CELL_SIZE = 20.0
+MAX_CELL_SIZE = 1000.0
+
+# Most cutoffs an /isochrone request may ask for; each one traces a grid
+MAX_CUTOFFS = 10
+
+# Upper bound on the seconds a /trip request may spend ordering its stops
+MAX_TIME_BUDGET = 5.0
+
+# Most alternative routes a /route request may ask for
+MAX_ALTERNATIVES = 4
+
+METHODS = ('plateau', 'penalty')
+
+
+class BadRequest(Exception):
+    """A request parameter is missing or invalid"""
+
+
+def _float(value, name):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        raise BadRequest(f"{name} is not a number: {value!r}")
+    if not math.isfinite(value):
+        raise BadRequest(f"{name} is not a finite number")
+    return value
+
+
+def number(params, name, default=None):
+    value = params.get(name, default)
+    if value is None:
+        raise BadRequest(f"Missing parameter: {name}")
+    return _float(value, name)
+
+
+def integer(params, name, default=None):
+    value = number(params, name, default)
+    if value != int(value):
+        raise BadRequest(f"{name} is not a whole number: {value!r}")
+    return int(value)
+
+
+def flag(params, name):
+    return str(params.get(name, '')).lower() in ('1', 'true', 'yes')
+
+
+def mode(params, default='distance'):
+    value = params.get('mode', default)
+    if not isinstance(value, str) or value not in RoutingEngine.WEIGHTS:
+        raise BadRequest(f"Unknown mode: {value}")
+    return value
+
+
+def departure(params):
+    """Departure as parsed by speeds.parse_departure, None for now"""
+    value = params.get('depart')
+    if value is not None and not isinstance(value, str):
+        raise BadRequest(f"depart is not a time: {value!r}")
+    try:
+        return parse_departure(value)
+    except ValueError:
+        raise BadRequest(f"depart is not HH:MM or an ISO datetime: {value!r}")
+
+
+def route_params(params):
+    """Arguments of a /route request"""
+    method = params.get('method', 'plateau')
+    if not isinstance(method, str) or method not in METHODS:
+        raise BadRequest(f"Unknown alternatives method: {method}")
+    max_overlap = number(params, 'max_overlap', MAX_OVERLAP)
+    if not 0 <= max_overlap <= 1:
+        raise BadRequest("max_overlap must be between 0 and 1")
+    max_stretch = number(params, 'max_stretch', MAX_STRETCH)
+    if max_stretch < 1:
+        raise BadRequest("max_stretch must be at least 1")
+    return {
+        'start': (number(params, 'lat1'), number(params, 'lon1')),
+        'end': (number(params, 'lat2'), number(params, 'lon2')),
+        'mode': mode(params),
+        'departure': departure(params),
+        'alternatives': min(max(integer(params, 'alternatives', 0), 0),
+                            MAX_ALTERNATIVES),
+        'max_overlap': max_overlap,
+        'max_stretch': max_stretch,
+        'method': method,
+    }
+
+
+def isochrone_params(params):
+    """Arguments of an /isochrone request; cutoffs come sorted"""
+    cutoffs = params.get('cutoffs', '600')
+    if isinstance(cutoffs, str):
+        cutoffs = cutoffs.split(',')
+    if not isinstance(cutoffs, list):
+        cutoffs = [cutoffs]
+    if len(cutoffs) > MAX_CUTOFFS:
+        raise BadRequest(f"An isochrone can have at most {MAX_CUTOFFS} cutoffs")
+    cutoffs = tuple(sorted(_float(c, 'cutoffs') for c in cutoffs))
+    if not cutoffs or cutoffs[0] < 0:
+        raise BadRequest("cutoffs must be one or more numbers of at least 0")
+    return {
+        'point': (number(params, 'lat'), number(params, 'lon')),
+        'cutoffs': cutoffs,
+        'mode': mode(params, 'time'),
+        'departure': departure(params),
+        'cell_size': min(max(number(params, 'cell', 100), MIN_CELL_SIZE),
+                         MAX_CELL_SIZE),
+    }
+
+
+def trip_params(params):
+    """Arguments of a /trip request"""
+    points = params.get('points')
+    if isinstance(points, str):
+        points = [p.split(',') for p in points.split(';')]
+    if not isinstance(points, list):
+        raise BadRequest("points must be lat,lon;lat,lon;... or a list")
+    if len(points) < 2:
+        raise BadRequest("A trip needs at least two points")
+    if len(points) > trip.MAX_STOPS:
+        raise BadRequest(f"A trip can have at most {trip.MAX_STOPS} stops")
+    stops = []
+    for point in points:
+        if not isinstance(point, (list, tuple)) or len(point) != 2:
+            raise BadRequest(f"A point is not a lat, lon pair: {point!r}")
+        stops.append((_float(point[0], 'lat'), _float(point[1], 'lon')))
+    return {
+        'points': stops,
+        'mode': mode(params),
+        'departure': departure(params),
+        'roundtrip': flag(params, 'roundtrip'),
+        'time_budget': min(number(params, 'time_budget', 1.0),
+                           MAX_TIME_BUDGET),
+    }
+
+
+def isochrone_features(cutoffs, geometries, mode_name):
+    """GeoJSON FeatureCollection of the polygons of sorted ``cutoffs``"""
+    return {'type': 'FeatureCollection', 'features': [
+        {'type': 'Feature',
+         'properties': {'cutoff': cutoff, 'mode': mode_name},
+         'geometry': geometry}
+        for cutoff, geometry in zip(cutoffs, geometries)]}
@@ -1,34 +1,209 @@
-from flask import Flask, request, jsonify
-import osmnx as ox
-import networkx as nx
-
-app = Flask(__name__)
-
-# Load the GraphML file
-GRAPHML_FILE = "hyderabad.graphml"
-graph = ox.load_graphml(GRAPHML_FILE)
-
-@app.route("/route", methods=["GET"])
-def get_route():
-    """Calculate the shortest path between two points (offline)."""
-    try:
-        lat1, lon1 = float(request.args.get("lat1")), float(request.args.get("lon1"))
-        lat2, lon2 = float(request.args.get("lat2")), float(request.args.get("lon2"))
-
-        # Find nearest nodes
-        node1 = ox.distance.nearest_nodes(graph, X=lon1, Y=lat1)
-        node2 = ox.distance.nearest_nodes(graph, X=lon2, Y=lat2)
-
-        # Compute shortest path
-        route = nx.shortest_path(graph, node1, node2, weight="length")
-
-        # Convert route to coordinates
-        route_coords = [(graph.nodes[n]["y"], graph.nodes[n]["x"]) for n in route]
-
-        return jsonify({"route": route_coords})
-
-    except Exception as e:
-        return jsonify({"error": str(e)})
-
-if __name__ == "__main__":
-    app.run(debug=True, port=5000)
+import json
+import os
+import threading
+import time
+from flask import Flask, Response, g, request, jsonify
+import api
+import metrics
+import trip
+from mapdata import MapTileProvider, RoutingEngine
+
+app = Flask(__name__)
+
+# Routed through the compiled-array cache of this GraphML file
+GRAPHML_FILE = "hyderabad.graphml"
+
+# Loaded by get_engine() rather than on import: /trip workers are started
+# with spawn on Windows and import this module again, and they load their
+# own graph in trip.init_worker
+engine = None
+engine_lock = threading.Lock()
+
+def get_engine():
+    """The routing engine of the serving process, loaded on first use"""
+    global engine
+    with engine_lock:
+        if engine is None:
+            loaded = RoutingEngine(GRAPHML_FILE, partitioned=True)
+            loaded.prepare()
+            engine = loaded
+    return engine
+
+# Tiles served by /tiles: the vector tiles written by vectortiles.py
+MBTILES_FILE = "hyderabad_vector.mbtiles"
+tiles = MapTileProvider(MBTILES_FILE) if os.path.exists(MBTILES_FILE) else None
+tile_metadata = tiles.metadata() if tiles else {}
+TILE_FORMAT = tile_metadata.get("format", "png")
+MIN_ZOOM = int(tile_metadata.get("minzoom", 0))
+MAX_ZOOM = int(tile_metadata.get("maxzoom", 22))
+
+TILE_TYPES = {
+    "pbf": "application/vnd.mapbox-vector-tile",
+    "png": "image/png",
+    "jpg": "image/jpeg",
+    "webp": "image/webp",
+}
+
+@app.before_request
+def start_timer():
+    g.start = time.perf_counter()
+
+@app.after_request
+def record_request(response):
+    if "start" in g:
+        endpoint = request.url_rule.rule if request.url_rule else "unknown"
+        metrics.request(endpoint, response.status_code,
+                        time.perf_counter() - g.start)
+    return response
+
+@app.route("/metrics", methods=["GET"])
+def get_metrics():
+    """Stage timings and counters in Prometheus text format.
+
+    Collected only when the server runs with ``ROUTING_METRICS=1``.
+    """
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+@app.route("/route", methods=["GET"])
+def get_route():
+    """Calculate the shortest or fastest path between two points (offline).
+
+    ``mode`` is ``distance`` (default) or ``time``; time routing uses the
+    speed profile for ``depart`` (ISO datetime or HH:MM, default now).
+    ``alternatives=N`` also returns up to N different routes, limited by
+    ``max_overlap``, ``max_stretch`` and ``method`` (plateau or penalty).
+    """
+    try:
+        params = api.route_params(request.args)
+        (lat1, lon1), (lat2, lon2) = params["start"], params["end"]
+
+        if params["alternatives"] > 0:
+            routes = get_engine().find_routes(
+                lat1, lon1, lat2, lon2, mode=params["mode"],
+                departure=params["departure"],
+                count=params["alternatives"] + 1,
+                max_overlap=params["max_overlap"],
+                max_stretch=params["max_stretch"],
+                method=params["method"])
+            if not routes:
+                return jsonify({"error": "No path between these points"}), 404
+            with metrics.stage("serialize"):
+                return jsonify(dict(routes[0], alternatives=routes[1:]))
+
+        # Snap to the nearest nodes and search the compiled graph
+        result = get_engine().find_route(lat1, lon1, lat2, lon2,
+                                         mode=params["mode"],
+                                         departure=params["departure"])
+        if result is None:
+            return jsonify({"error": "No path between these points"}), 404
+
+        with metrics.stage("serialize"):
+            return jsonify(result)
+
+    except api.BadRequest as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/isochrone", methods=["GET"])
+def get_isochrone():
+    """Areas reachable from a point within one or more cutoffs (offline).
+
+    ``cutoffs`` is a comma-separated list, in seconds for ``mode=time``
+    (default) or metres for ``mode=distance``. ``cell`` is the grid size of
+    the polygons in metres. Returns a GeoJSON FeatureCollection.
+    """
+    try:
+        params = api.isochrone_params(request.args)
+        lat, lon = params["point"]
+
+        geometries = get_engine().isochrones(
+            lat, lon, params["cutoffs"], mode=params["mode"],
+            departure=params["departure"], cell_size=params["cell_size"])
+        with metrics.stage("serialize"):
+            return jsonify(api.isochrone_features(
+                params["cutoffs"], geometries, params["mode"]))
+
+    except api.BadRequest as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/trip", methods=["GET", "POST"])
+def get_trip():
+    """Visit several stops in an optimised order, starting at the first (offline).
+
+    Stops come as ``points=lat,lon;lat,lon;...`` or as a JSON body
+    ``{"points": [[lat, lon], ...]}``. ``roundtrip=1`` returns to the first
+    stop; ``mode`` and ``depart`` work as for /route and ``time_budget``
+    caps the seconds spent improving the order.
+    """
+    try:
+        body = request.get_json(silent=True)
+        if body is not None and not isinstance(body, dict):
+            raise api.BadRequest("Request body must be a JSON object")
+        params = api.trip_params(body or request.args)
+
+        result = get_engine().optimize_stops(
+            params["points"], mode=params["mode"],
+            departure=params["departure"], roundtrip=params["roundtrip"],
+            time_budget=params["time_budget"])
+        with metrics.stage("serialize"):
+            return jsonify(result)
+
+    except api.BadRequest as e:
+        return jsonify({"error": str(e)}), 400
+    except trip.Unreachable as e:
+        return jsonify({"error": str(e)}), 404
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/tiles/<int:z>/<int:x>/<int:y>", methods=["GET"])
+@app.route("/tiles/<int:z>/<int:x>/<int:y>.<ext>", methods=["GET"])
+def get_tile(z, x, y, ext=None):
+    """One map tile in XYZ numbering, as stored in the MBTiles file.
+
+    Vector tiles are stored gzipped and sent that way with a
+    Content-Encoding header, so they are never decompressed here. Tiles
+    outside the stored zoom range or in another format are 404s.
+    """
+    if tiles is None:
+        return jsonify({"error": f"No tile file: {MBTILES_FILE}"}), 404
+    if ext is not None and ext != TILE_FORMAT:
+        return jsonify({"error": f"Tiles are {TILE_FORMAT}, not {ext}"}), 404
+    if not MIN_ZOOM <= z <= MAX_ZOOM or x >= 1 << z or y >= 1 << z:
+        return jsonify({"error": "No such tile"}), 404
+    # MBTiles rows count from the south
+    data = tiles.get_tile(z, x, (1 << z) - 1 - y)
+    if data is None:
+        return jsonify({"error": "No such tile"}), 404
+    response = Response(data, mimetype=TILE_TYPES.get(
+        TILE_FORMAT, "application/octet-stream"))
+    if data[:2] == b"\x1f\x8b":
+        response.headers["Content-Encoding"] = "gzip"
+    response.headers["Cache-Control"] = "public, max-age=86400"
+    return response
+
+@app.route("/tiles.json", methods=["GET"])
+def get_tilejson():
+    """TileJSON description of /tiles, for MapLibre and similar clients"""
+    if tiles is None:
+        return jsonify({"error": f"No tile file: {MBTILES_FILE}"}), 404
+    tilejson = {
+        "tilejson": "2.2.0",
+        "name": tile_metadata.get("name", ""),
+        "format": TILE_FORMAT,
+        "tiles": [request.host_url + "tiles/{z}/{x}/{y}." + TILE_FORMAT],
+        "minzoom": MIN_ZOOM,
+        "maxzoom": MAX_ZOOM,
+    }
+    for key in ("bounds", "center"):
+        if key in tile_metadata:
+            tilejson[key] = [float(v) for v in tile_metadata[key].split(",")]
+    if "json" in tile_metadata:
+        tilejson.update(json.loads(tile_metadata["json"]))
+    return jsonify(tilejson)
+
+if __name__ == "__main__":
+    get_engine()
+    app.run(debug=True, port=5000)
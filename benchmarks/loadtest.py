@@ -0,0 +1,198 @@
+"""Load test for the async routing service (server.py).
+
+Fires /route requests between random nodes from many concurrent
+keep-alive connections and reports latency percentiles, throughput and
+the status codes seen. A share of the requests repeat a few hot pairs, so
+the server's coalescing of duplicate searches shows up in the results.
+
+Without ``--url`` the script starts ``uvicorn server:app`` itself on the
+graph given by ``--graph``, or on a synthetic street grid.
+
+Usage:
+    python benchmarks/loadtest.py [--requests 2000] [--concurrency 32]
+                                  [--duplicates 0.5] [--url http://host:8000]
+                                  [--graph hyderabad.graphml] [--json out.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from urllib.parse import urlsplit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import synthetic  # noqa: E402
+from graph import load_compiled  # noqa: E402
+
+# Hot pairs the duplicate share of the requests is drawn from
+HOT_PAIRS = 8
+
+# Give up on a server that has not answered /health after this many seconds
+START_TIMEOUT_S = 300
+
+
+def make_paths(graph, count, duplicates, mode, seed=0):
+    """Query paths for ``count`` /route requests"""
+    rng = random.Random(seed)
+    lat, lon = graph.lat.tolist(), graph.lon.tolist()
+
+    def path(source, target):
+        return (f"/route?lat1={lat[source]}&lon1={lon[source]}"
+                f"&lat2={lat[target]}&lon2={lon[target]}&mode={mode}")
+
+    hot = [path(s, t) for s, t in synthetic.random_pairs(graph, HOT_PAIRS,
+                                                          seed)]
+    cold = [path(s, t) for s, t in synthetic.random_pairs(graph, count,
+                                                           seed + 1)]
+    return [rng.choice(hot) if rng.random() < duplicates else cold[i]
+            for i in range(count)]
+
+
+async def _get(reader, writer, host, path):
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\n\r\n".encode())
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        if name.lower() == "content-length":
+            length = int(value)
+    await reader.readexactly(length)
+    return status
+
+
+async def run_load(url, paths, concurrency):
+    """Latencies in seconds and status codes of every request, and wall time"""
+    parts = urlsplit(url)
+    queue = list(reversed(paths))
+    latencies, statuses = [], []
+
+    async def client():
+        reader, writer = await asyncio.open_connection(parts.hostname,
+                                                       parts.port or 80)
+        try:
+            while queue:
+                path = queue.pop()
+                start = time.perf_counter()
+                status = await _get(reader, writer, parts.netloc, path)
+                latencies.append(time.perf_counter() - start)
+                statuses.append(status)
+        finally:
+            writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return latencies, statuses, time.perf_counter() - start
+
+
+def _percentile(values, q):
+    return statistics.quantiles(values, n=100, method="inclusive")[q - 1]
+
+
+def summarize(latencies, statuses, elapsed):
+    ok = [t for t, s in zip(latencies, statuses) if s == 200]
+    codes = {}
+    for status in statuses:
+        codes[str(status)] = codes.get(str(status), 0) + 1
+    return {
+        "requests": len(statuses),
+        "seconds": elapsed,
+        "rps": len(statuses) / elapsed,
+        "status": codes,
+        "p50_ms": _percentile(ok, 50) * 1000 if len(ok) > 1 else None,
+        "p99_ms": _percentile(ok, 99) * 1000 if len(ok) > 1 else None,
+        "max_ms": max(ok) * 1000 if ok else None,
+    }
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(graph_path):
+    """Run uvicorn on server:app in a child process; returns (proc, url)"""
+    port = _free_port()
+    env = dict(os.environ, ROUTING_GRAPH=os.path.abspath(graph_path))
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--port", str(port),
+         "--log-level", "warning"],
+        cwd=ROOT, env=env)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + START_TIMEOUT_S
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError("The server exited during startup")
+        try:
+            urllib.request.urlopen(url + "/health", timeout=1).read()
+            return proc, url
+        except OSError:
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError("The server did not start in time")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duplicates", type=float, default=0.5,
+                        help="share of requests repeating a few hot pairs")
+    parser.add_argument("--mode", default="distance")
+    parser.add_argument("--url", help="running server to test")
+    parser.add_argument("--graph", help="road network instead of the grid")
+    parser.add_argument("--size", type=int, default=100,
+                        help="nodes per side of the synthetic grid")
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.graph:
+            graph_path = args.graph
+            graph = load_compiled(graph_path)
+        else:
+            graph = synthetic.grid_graph(args.size)
+            graph_path = os.path.join(tmp, "grid.npz")
+            graph.save(graph_path)
+        paths = make_paths(graph, args.requests, args.duplicates, args.mode)
+
+        proc, url = (None, args.url) if args.url else start_server(graph_path)
+        try:
+            latencies, statuses, elapsed = asyncio.run(
+                run_load(url, paths, args.concurrency))
+            with urllib.request.urlopen(url + "/health") as response:
+                health = json.load(response)
+        finally:
+            if proc is not None:
+                proc.terminate()
+                proc.wait()
+
+    results = dict(summarize(latencies, statuses, elapsed),
+                   concurrency=args.concurrency,
+                   duplicates=args.duplicates, server=health)
+    print(f"{results['requests']} requests in {elapsed:.2f} s "
+          f"= {results['rps']:.0f} req/s, status {results['status']}")
+    if results["p50_ms"] is not None:
+        print(f"latency p50 {results['p50_ms']:.1f} ms, "
+              f"p99 {results['p99_ms']:.1f} ms, max {results['max_ms']:.1f} ms")
+    print(f"server: {health}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
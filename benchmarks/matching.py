@@ -0,0 +1,92 @@
+"""Map-matching throughput in GPS points per second.
+
+Noisy traces are sampled along random routes, then matched twice: one
+point at a time through a streaming session, and as a batch across a
+process pool. Runs on a synthetic street grid unless ``--graph`` names a
+road network (or its compiled ``.npz``).
+
+Usage:
+    python benchmarks/matching.py [--traces 200] [--workers 4]
+                                  [--graph hyderabad.graphml] [--json out.json]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import synthetic  # noqa: E402
+from graph import load_compiled  # noqa: E402
+from mapmatch import MapMatcher, match_many  # noqa: E402
+
+
+def measure_streaming(graph, traces):
+    """Match every trace point by point in this process"""
+    matcher = MapMatcher(graph)
+    points = matched = 0
+    start = time.perf_counter()
+    for trace in traces:
+        session = matcher.session()
+        for lat, lon in trace:
+            matched += len(session.push(lat, lon))
+        matched += len(session.finish())
+        points += len(trace)
+    elapsed = time.perf_counter() - start
+    return {'points': points, 'matched': matched, 'seconds': elapsed,
+            'points_per_s': points / elapsed}
+
+
+def measure_batch(graph_path, traces, workers):
+    """Match the traces across a process pool, pool start-up included"""
+    points = sum(len(trace) for trace in traces)
+    start = time.perf_counter()
+    results = match_many(graph_path, traces, workers)
+    elapsed = time.perf_counter() - start
+    return {'points': points, 'matched': sum(map(len, results)),
+            'workers': workers, 'seconds': elapsed,
+            'points_per_s': points / elapsed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--traces', type=int, default=200)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--graph', help="road network instead of the grid")
+    parser.add_argument('--size', type=int, default=100,
+                        help="nodes per side of the synthetic grid")
+    parser.add_argument('--json', help="write the results to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.graph:
+            graph_path = args.graph
+            graph = load_compiled(graph_path)
+        else:
+            graph = synthetic.grid_graph(args.size)
+            graph_path = os.path.join(tmp, 'grid.npz')
+            graph.save(graph_path)
+
+        traces = synthetic.gps_traces(graph, args.traces)
+        results = {
+            'graph': args.graph or f'grid {args.size}x{args.size}',
+            'traces': len(traces),
+            'streaming': measure_streaming(graph, traces),
+            'batch': measure_batch(graph_path, traces, args.workers),
+        }
+
+    for mode in ('streaming', 'batch'):
+        r = results[mode]
+        print(f"{mode:10s} {r['points']} points in {r['seconds']:.2f} s "
+              f"= {r['points_per_s']:.0f} points/s "
+              f"({r['matched']} matched)")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
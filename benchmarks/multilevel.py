@@ -0,0 +1,151 @@
+"""Whole-graph A* against the multi-level search over a partition.
+
+Builds a partition (partition.py) of a synthetic street grid, or of the
+graph given by ``--graph``, then runs the same queries in two fresh
+processes: one loading the whole compiled graph and one opening the
+partition. Reports the build time, query latency, peak memory of each
+process and whether both found routes of the same cost.
+
+Usage:
+    python benchmarks/multilevel.py [--size 150] [--cell-nodes 1000]
+                                    [--max-cells 256] [--queries 50]
+                                    [--graph hyderabad.graphml]
+                                    [--json out.json]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import synthetic  # noqa: E402
+from graph import load_compiled  # noqa: E402
+from partition import PartitionedGraph, build_partition  # noqa: E402
+from search import shortest_path  # noqa: E402
+
+SEED = 42
+DEPARTURE = 9 * 3600
+
+
+def run_queries(mode, path, pairs, weight, max_cells):
+    """Costs and latencies of ``pairs`` in this process, and its peak RSS"""
+    start = time.perf_counter()
+    if mode == 'whole':
+        graph = load_compiled(path)
+        graph.adjacency(weight)
+
+        def search(s, t):
+            return shortest_path(graph, s, t, weight=weight,
+                                 departure=DEPARTURE)
+    else:
+        graph = PartitionedGraph(path, max_cells)
+
+        def search(s, t):
+            return graph.shortest_path(s, t, weight=weight,
+                                       departure=DEPARTURE)
+    opened = time.perf_counter() - start
+
+    costs, times = [], []
+    for source, target in pairs:
+        start = time.perf_counter()
+        route = search(source, target)
+        times.append(time.perf_counter() - start)
+        costs.append(None if route is None else route.cost)
+    times.sort()
+    result = {
+        'open_s': opened,
+        'p50_ms': times[len(times) // 2] * 1000,
+        'p99_ms': times[min(len(times) - 1, int(len(times) * 0.99))] * 1000,
+        'mean_ms': statistics.fmean(times) * 1000,
+    }
+    result['peak_rss_mb'] = peak_rss_mb()
+    return costs, result
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process, or None where unknown"""
+    # ru_maxrss survives exec on Linux, so a spawned child would report
+    # its parent's peak; the kernel's own high-water mark does not
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    if resource is not None:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return None
+
+
+def in_child(*args):
+    """run_queries in a fresh process, so memory figures are its own"""
+    with multiprocessing.get_context('spawn').Pool(1) as pool:
+        return pool.apply(run_queries, args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size', type=int, default=150,
+                        help="nodes per side of the synthetic grid")
+    parser.add_argument('--cell-nodes', type=int, default=1000,
+                        help="largest number of nodes in a finest cell")
+    parser.add_argument('--max-cells', type=int, default=256,
+                        help="cells the partitioned search keeps loaded")
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--graph', help="road network instead of the grid")
+    parser.add_argument('--json', help="write results to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.graph:
+            graph_path = args.graph
+            graph = load_compiled(graph_path)
+        else:
+            graph = synthetic.grid_graph(args.size)
+            graph_path = os.path.join(tmp, 'grid.npz')
+            graph.save(graph_path)
+        pairs = synthetic.random_pairs(graph, args.queries, SEED)
+        cells_path = os.path.join(tmp, 'cells')
+        start = time.perf_counter()
+        build_partition(graph, cells_path, max_cell_nodes=args.cell_nodes)
+        results = {
+            'nodes': graph.num_nodes,
+            'build_s': time.perf_counter() - start,
+        }
+        with open(os.path.join(cells_path, 'meta.json')) as f:
+            results['partition'] = json.load(f)
+        del graph
+
+        for weight in ('length', 'travel_time'):
+            whole_costs, results[f'whole_{weight}'] = in_child(
+                'whole', graph_path, pairs, weight, args.max_cells)
+            part_costs, results[f'multilevel_{weight}'] = in_child(
+                'multilevel', cells_path, pairs, weight, args.max_cells)
+            if weight == 'length':
+                # The partition's travel times use one bucket per route, so
+                # only distances are expected to match exactly
+                results['mismatches'] = sum(
+                    (a is None) != (b is None)
+                    or (a is not None and abs(a - b) > 1e-3 * max(a, 1.0))
+                    for a, b in zip(whole_costs, part_costs))
+
+    print(json.dumps(results, indent=2))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
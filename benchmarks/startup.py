@@ -0,0 +1,183 @@
+"""Cold-start benchmark for the desktop apps.
+
+Every measurement runs in a fresh interpreter so nothing is warm:
+
+- import time of each app module, plus which heavy modules it pulls in
+- time until the main window is shown, and until its data has loaded
+
+Usage:
+    python benchmarks/startup.py [--repeat 5] [--json out.json]
+                                 [--baseline old.json] [--tolerance 0.25]
+
+With ``--baseline`` the medians are compared against an earlier ``--json``
+file and the script exits non-zero when any of them regressed by more than
+``--tolerance``.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# module -> (window class, data files it needs before it can start)
+APPS = {
+    'a': ('OfflineMapApp', []),
+    'ui': ('OfflineMapsApp', ['offline_data/road_network.pkl',
+                              'offline_data/geocoding.json']),
+}
+
+HEAVY_MODULES = ('osmnx', 'geopandas', 'osmium', 'shapely', 'folium',
+                 'networkx', 'rtree')
+
+# Give up on a startup that has not finished loading after this many seconds
+LOAD_TIMEOUT_S = 300
+
+
+def measure_import(module):
+    """Wall time of ``import module`` and the breakdown from -X importtime"""
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=ROOT, capture_output=True, text=True, env=_child_env())
+    elapsed = time.perf_counter() - start
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr[-2000:]}")
+
+    top_level = []
+    imported = set()
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        imported.add(name.strip().split('.')[0])
+        if not name.startswith('  '):
+            top_level.append((name.strip(), int(cumulative) / 1000))
+    top_level.sort(key=lambda item: item[1], reverse=True)
+    return {
+        'wall_s': elapsed,
+        'slowest_ms': dict(top_level[:10]),
+        'heavy_imported': sorted(m for m in HEAVY_MODULES if m in imported),
+    }
+
+
+def measure_startup(module):
+    proc = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--child', module],
+        cwd=ROOT, capture_output=True, text=True, env=_child_env())
+    for line in reversed(proc.stdout.splitlines()):
+        if line.startswith('{'):
+            return json.loads(line)
+    raise RuntimeError(f"startup of {module} failed:\n{proc.stderr[-2000:]}")
+
+
+def run_child(module):
+    """Start one app in this process and print its timings as JSON"""
+    start = time.perf_counter()
+    import importlib
+    from PyQt5.QtCore import QTimer
+    from PyQt5.QtWidgets import QApplication
+
+    # QtWebEngine has to be imported before the QApplication exists
+    imported = importlib.import_module(module)
+    import_s = time.perf_counter() - start
+    app = QApplication(sys.argv)
+
+    window = getattr(imported, APPS[module][0])()
+    window.show()
+    app.processEvents()
+    shown_s = time.perf_counter() - start
+
+    result = {'import_s': import_s, 'window_s': shown_s,
+              'loaded_s': None, 'loaded_ok': False}
+
+    def on_loaded(ok):
+        result['loaded_s'] = time.perf_counter() - start
+        result['loaded_ok'] = ok
+        app.quit()
+
+    window.loader.finished.connect(on_loaded)
+    QTimer.singleShot(LOAD_TIMEOUT_S * 1000, app.quit)
+    app.exec_()
+    print(json.dumps(result))
+
+
+def _child_env():
+    env = dict(os.environ)
+    env.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    return env
+
+
+def _median(runs, key):
+    values = [run[key] for run in runs if run.get(key) is not None]
+    return statistics.median(values) if values else None
+
+
+def benchmark(repeat):
+    results = {}
+    for module, (_, required) in APPS.items():
+        imports = [measure_import(module) for _ in range(repeat)]
+        entry = {
+            'import_s': statistics.median(run['wall_s'] for run in imports),
+            'slowest_imports_ms': imports[-1]['slowest_ms'],
+            'heavy_imported': imports[-1]['heavy_imported'],
+        }
+        missing = [f for f in required
+                   if not os.path.exists(os.path.join(ROOT, f))]
+        if missing:
+            entry['startup_skipped'] = f"missing {', '.join(missing)}"
+        else:
+            runs = [measure_startup(module) for _ in range(repeat)]
+            entry['window_s'] = _median(runs, 'window_s')
+            entry['loaded_s'] = _median(runs, 'loaded_s')
+            entry['loaded_ok'] = all(run['loaded_ok'] for run in runs)
+        results[module] = entry
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Metrics that got slower than the baseline by more than ``tolerance``"""
+    regressions = []
+    for module, entry in results.items():
+        for key in ('import_s', 'window_s', 'loaded_s'):
+            old = baseline.get(module, {}).get(key)
+            new = entry.get(key)
+            if old and new and new > old * (1 + tolerance):
+                regressions.append(f"{module}.{key}: {old:.3f}s -> {new:.3f}s")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--json', help="write results to this file")
+    parser.add_argument('--baseline', help="results file to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        sys.path.insert(0, ROOT)
+        run_child(args.child)
+        return
+
+    results = benchmark(args.repeat)
+    print(json.dumps(results, indent=2))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"Regression: {line}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
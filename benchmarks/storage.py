@@ -0,0 +1,164 @@
+"""Throughput of the SQLite stores under concurrent readers.
+
+Runs tile and address lookups from 1 to N threads at once, one lookup at a
+time and in batches (``get_tiles``, ``search_many``), and compares them with
+a single connection shared behind a lock, the way both stores used to work.
+Uses generated address and tile files unless ``--addresses``/``--tiles``
+name real ones.
+
+Usage:
+    python benchmarks/storage.py [--threads 1,2,4,8] [--seconds 2]
+                                 [--tiles hyd.mbtiles] [--json out.json]
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import synthetic  # noqa: E402
+from mapdata import AddressDatabase, MapTileProvider  # noqa: E402
+
+SEED = 42
+# Keys per get_tiles call and queries per search_many call
+TILE_BATCH = 50
+SEARCH_BATCH = 10
+
+
+class SharedReader:
+    """One connection behind a lock, as the stores had before the pool"""
+
+    def __init__(self, db_path):
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.lock = threading.Lock()
+
+    def get_tile(self, zoom, x, y):
+        with self.lock:
+            return self.conn.execute(MapTileProvider.TILE,
+                                     (zoom, x, y)).fetchone()
+
+    def search_address(self, query):
+        with self.lock:
+            return self.conn.execute(AddressDatabase.SEARCH,
+                                     (f'%{query}%', f'%{query}%')).fetchall()
+
+
+def throughput(call, batches, threads, seconds):
+    """Items per second with ``threads`` threads calling ``call`` in a loop.
+
+    Each thread cycles through its own slice of ``batches``; a call on a
+    batch counts as ``len(batch)`` items.
+    """
+    stop = time.perf_counter() + seconds
+    done = [0] * threads
+
+    def worker(n):
+        mine = batches[n::threads] or batches
+        i = 0
+        while time.perf_counter() < stop:
+            batch = mine[i % len(mine)]
+            call(batch)
+            done[n] += len(batch)
+            i += 1
+
+    pool = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    start = time.perf_counter()
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return sum(done) / (time.perf_counter() - start)
+
+
+def _chunks(items, size):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def bench_tiles(path, thread_counts, seconds):
+    provider = MapTileProvider(path)
+    shared = SharedReader(path)
+    with provider.readers.connection() as conn:
+        keys = conn.execute(
+            'SELECT zoom_level, tile_column, tile_row FROM tiles').fetchall()
+    rng = random.Random(SEED)
+    sample = [rng.choice(keys) for _ in range(TILE_BATCH * 100)]
+    singles = [[key] for key in sample]
+    cases = {
+        'shared_get_tile': (lambda b: shared.get_tile(*b[0]), singles),
+        'get_tile': (lambda b: provider.get_tile(*b[0]), singles),
+        'get_tiles': (provider.get_tiles, _chunks(sample, TILE_BATCH)),
+    }
+    results = {name: {threads: throughput(call, batches, threads, seconds)
+                      for threads in thread_counts}
+               for name, (call, batches) in cases.items()}
+    provider.close()
+    return results
+
+
+def bench_addresses(path, thread_counts, seconds):
+    db = AddressDatabase(path)
+    shared = SharedReader(path)
+    with db.readers.connection() as conn:
+        streets = [row[0] for row in conn.execute(
+            'SELECT street FROM addresses').fetchall() if row[0]]
+    rng = random.Random(SEED)
+    sample = [rng.choice(streets)[:6] for _ in range(SEARCH_BATCH * 20)]
+    singles = [[query] for query in sample]
+    cases = {
+        'shared_search_address': (lambda b: shared.search_address(b[0]),
+                                  singles),
+        'search_address': (lambda b: db.search_address(b[0]), singles),
+        'search_many': (db.search_many, _chunks(sample, SEARCH_BATCH)),
+    }
+    results = {name: {threads: throughput(call, batches, threads, seconds)
+                      for threads in thread_counts}
+               for name, (call, batches) in cases.items()}
+    db.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', default='1,2,4,8',
+                        help="comma-separated thread counts")
+    parser.add_argument('--seconds', type=float, default=2.0,
+                        help="duration of each measurement")
+    parser.add_argument('--tiles', help="MBTiles file instead of generated")
+    parser.add_argument('--addresses', help="address DB instead of generated")
+    parser.add_argument('--json', help="write results to this file")
+    args = parser.parse_args()
+    thread_counts = [int(n) for n in args.threads.split(',')]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tiles = args.tiles or os.path.join(tmp, 'tiles.mbtiles')
+        addresses = args.addresses or os.path.join(tmp, 'addresses.db')
+        if not args.tiles:
+            synthetic.tile_table(tiles)
+        if not args.addresses:
+            synthetic.address_table(addresses)
+        results = {
+            'cpus': os.cpu_count(),
+            'tiles_per_s': bench_tiles(tiles, thread_counts, args.seconds),
+            'queries_per_s': bench_addresses(addresses, thread_counts,
+                                             args.seconds),
+        }
+
+    for unit in ('tiles_per_s', 'queries_per_s'):
+        print(f"{unit:20s}" + ''.join(f"{n:>10d} thr" for n in thread_counts))
+        for name, by_threads in results[unit].items():
+            print(f"  {name:18s}" + ''.join(f"{by_threads[n]:14.0f}"
+                                            for n in thread_counts))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,271 @@
+"""Routing, geocoding and tile benchmarks on reproducible query sets.
+
+Measures, per dataset:
+
+- graph load, snapping index build and search warm-up (time and memory)
+- snapping, single routes (shortest and fastest) and a stop-to-stop matrix
+- address search on full names and on short prefixes (autocomplete)
+- map tile fetches
+
+The ``synthetic`` dataset is generated on the fly (street grid, address
+table and MBTiles file), so the suite runs without any data files. The
+``hyderabad`` dataset uses hyderabad.graphml, addresses.db and the
+Hyderabad MBTiles file, skipping whichever of them is missing. Queries come
+from a fixed seed, so runs on different commits are comparable.
+
+Usage:
+    python benchmarks/suite.py [--queries 100] [--size 200] [--json out.json]
+                               [--baseline old.json] [--tolerance 0.25]
+
+With ``--baseline`` the results are compared against an earlier ``--json``
+file and the script exits non-zero when any latency, duration or memory
+figure regressed by more than ``--tolerance``.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import synthetic  # noqa: E402
+from graph import load_compiled  # noqa: E402
+from mapdata import AddressDatabase, MapTileProvider, RoutingEngine  # noqa: E402
+from search import one_to_many, shortest_path  # noqa: E402
+
+# Real data files, relative to the repository root
+HYDERABAD = {
+    'graph': 'hyderabad.graphml',
+    'addresses': 'addresses.db',
+    'tiles': 'osm-2020-02-10-v3.11_india_hyderabad (1).mbtiles',
+}
+
+# Seed of every query set
+SEED = 42
+
+# Stops in the matrix benchmark, and departure of the time-dependent runs
+MATRIX_STOPS = 20
+DEPARTURE = 9 * 3600
+
+# Figures compared against a baseline; lower is better for all of them
+COMPARED = ('seconds', 'p50_ms', 'p99_ms', 'peak_mb')
+
+
+def latency(fn, queries):
+    """Per-call latency percentiles of ``fn`` over a query set"""
+    times = []
+    for query in queries:
+        start = time.perf_counter()
+        fn(*query)
+        times.append(time.perf_counter() - start)
+    times.sort()
+    return {
+        'n': len(times),
+        'mean_ms': statistics.fmean(times) * 1000,
+        'p50_ms': times[len(times) // 2] * 1000,
+        'p99_ms': times[min(len(times) - 1, int(len(times) * 0.99))] * 1000,
+    }
+
+
+def footprint(fn):
+    """Result, seconds and peak traced memory in MB of one call.
+
+    Both figures come from the same call. The seconds include the cost of
+    tracing allocations, which is the same on every run, so they compare
+    across commits but read higher than an untraced call would.
+    """
+    tracemalloc.start()
+    try:
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, {'seconds': elapsed, 'peak_mb': peak / 2 ** 20}
+
+
+def bench_graph(graph_path, queries):
+    results = {}
+    # Write the compiled-array cache first when it is missing or stale, so
+    # the load measured is the usual one from the cache
+    load_compiled(graph_path)
+    engine, results['graph_load'] = footprint(
+        lambda: RoutingEngine(graph_path, workers=1))
+    graph = engine.compiled
+    results['graph_load'].update(nodes=graph.num_nodes,
+                                 edges=int(graph.indptr[-1]))
+
+    def build_index():
+        engine._idx = None
+        return engine.idx
+
+    def warm_up():
+        graph._lists.clear()
+        engine.prepare()
+
+    _, results['snap_index'] = footprint(build_index)
+    _, results['prepare'] = footprint(warm_up)
+
+    rng = random.Random(SEED)
+    lat_min, lat_max = float(graph.lat.min()), float(graph.lat.max())
+    lon_min, lon_max = float(graph.lon.min()), float(graph.lon.max())
+    points = [(rng.uniform(lat_min, lat_max), rng.uniform(lon_min, lon_max))
+              for _ in range(queries)]
+    results['snap'] = latency(engine.nearest_index, points)
+
+    pairs = synthetic.random_pairs(graph, queries, SEED)
+    results['route_distance'] = latency(
+        lambda s, t: shortest_path(graph, s, t), pairs)
+    results['route_time'] = latency(
+        lambda s, t: shortest_path(graph, s, t, weight='travel_time',
+                                   departure=DEPARTURE), pairs)
+
+    stops = [s for s, _ in synthetic.random_pairs(graph, MATRIX_STOPS,
+                                                   SEED + 1)]
+    for weight in ('length', 'travel_time'):
+        _, results[f'matrix_{weight}'] = footprint(
+            lambda: [one_to_many(graph, s, stops, weight, DEPARTURE)
+                     for s in stops])
+        results[f'matrix_{weight}']['stops'] = MATRIX_STOPS
+    return results
+
+
+def bench_addresses(db_path, queries):
+    # AddressDatabase creates its table on open, so it gets a copy rather
+    # than the data file itself
+    with tempfile.TemporaryDirectory() as tmp:
+        copy = os.path.join(tmp, os.path.basename(db_path))
+        shutil.copyfile(db_path, copy)
+        return _bench_addresses(copy, queries)
+
+
+def _bench_addresses(db_path, queries):
+    db = AddressDatabase(db_path)
+    with db.readers.connection() as conn:
+        streets = [row[0] for row in conn.execute(
+            'SELECT street FROM addresses ORDER BY id').fetchall() if row[0]]
+    if not streets:
+        db.close()
+        return {}
+    rng = random.Random(SEED)
+    names = [(rng.choice(streets),) for _ in range(queries)]
+    prefixes = [(name[:3],) for (name,) in names]
+    results = {
+        'rows': len(streets),
+        'geocode': latency(db.search_address, names),
+        'autocomplete': latency(db.search_address, prefixes),
+    }
+    db.close()
+    return results
+
+
+def bench_tiles(mbtiles_path, queries):
+    provider = MapTileProvider(mbtiles_path)
+    with provider.readers.connection() as conn:
+        keys = conn.execute(
+            'SELECT zoom_level, tile_column, tile_row FROM tiles').fetchall()
+    if not keys:
+        provider.close()
+        return {}
+    rng = random.Random(SEED)
+    results = {
+        'tiles': len(keys),
+        'tile_fetch': latency(provider.get_tile,
+                              [rng.choice(keys) for _ in range(queries)]),
+    }
+    provider.close()
+    return results
+
+
+def run_dataset(files, queries):
+    results = {}
+    for key, bench in (('graph', bench_graph),
+                       ('addresses', bench_addresses),
+                       ('tiles', bench_tiles)):
+        path = files.get(key)
+        if path and os.path.exists(path):
+            results.update(bench(path, queries))
+        else:
+            results.setdefault('skipped', []).append(key)
+    return results
+
+
+def benchmark(queries, size):
+    results = {'queries': queries, 'seed': SEED}
+    with tempfile.TemporaryDirectory() as tmp:
+        files = {
+            'graph': os.path.join(tmp, 'grid.npz'),
+            'addresses': os.path.join(tmp, 'addresses.db'),
+            'tiles': os.path.join(tmp, 'tiles.mbtiles'),
+        }
+        synthetic.grid_graph(size).save(files['graph'])
+        synthetic.address_table(files['addresses'])
+        synthetic.tile_table(files['tiles'])
+        results['synthetic'] = run_dataset(files, queries)
+        results['synthetic']['grid_size'] = size
+
+    files = {key: os.path.join(ROOT, name) for key, name in HYDERABAD.items()}
+    if any(os.path.exists(path) for path in files.values()):
+        results['hyderabad'] = run_dataset(files, queries)
+    if resource is not None:
+        results['max_rss_mb'] = (
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Figures that got worse than the baseline by more than ``tolerance``"""
+    regressions = []
+    for dataset in ('synthetic', 'hyderabad'):
+        for stage, entry in results.get(dataset, {}).items():
+            if not isinstance(entry, dict):
+                continue
+            for key in COMPARED:
+                old = baseline.get(dataset, {}).get(stage, {}).get(key)
+                new = entry.get(key)
+                if old and new and new > old * (1 + tolerance):
+                    regressions.append(
+                        f"{dataset}.{stage}.{key}: {old:.3f} -> {new:.3f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--queries', type=int, default=100)
+    parser.add_argument('--size', type=int, default=200,
+                        help="nodes per side of the synthetic grid")
+    parser.add_argument('--json', help="write results to this file")
+    parser.add_argument('--baseline', help="results file to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    args = parser.parse_args()
+
+    results = benchmark(args.queries, args.size)
+    print(json.dumps(results, indent=2))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"Regression: {line}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+"""Synthetic road data so benchmarks run without the Hyderabad files."""
+import math
+import random
+import sqlite3
+
+import numpy as np
+
+from graph import CompiledGraph
+from speeds import HIGHWAY_CODES
+from search import haversine, shortest_path
+
+# South-west corner of the synthetic grid, in central Hyderabad
+ORIGIN = (17.36, 78.44)
+
+STREET_WORDS = ['Banjara', 'Jubilee', 'Madhapur', 'Ameerpet', 'Begumpet',
+                'Kondapur', 'Gachibowli', 'Somajiguda', 'Abids', 'Himayat',
+                'Kukatpally', 'Tarnaka', 'Secunderabad', 'Mehdipatnam',
+                'Lakdikapul', 'Nampally', 'Koti', 'Charminar', 'Uppal',
+                'Miyapur']
+STREET_TYPES = ['Road', 'Street', 'Colony', 'Nagar', 'Marg', 'Lane']
+CITIES = ['Hyderabad', 'Secunderabad', 'Cyberabad']
+
+
+def grid_graph(size=100, spacing=100.0, seed=0):
+    """Two-way street grid of ``size`` x ``size`` nodes ``spacing`` metres apart.
+
+    Every tenth row and column is a primary road, the rest residential.
+    Each edge gets a slight bend so edge geometry has more than two points.
+    """
+    rng = np.random.default_rng(seed)
+    dlat = spacing / 111320.0
+    dlon = spacing / (111320.0 * math.cos(math.radians(ORIGIN[0])))
+    rows, cols = np.divmod(np.arange(size * size), size)
+    lat = ORIGIN[0] + rows * dlat + rng.normal(0, dlat * 0.05, size * size)
+    lon = ORIGIN[1] + cols * dlon + rng.normal(0, dlon * 0.05, size * size)
+
+    ids = np.arange(size * size).reshape(size, size)
+    right = np.column_stack((ids[:, :-1].ravel(), ids[:, 1:].ravel()))
+    up = np.column_stack((ids[:-1, :].ravel(), ids[1:, :].ravel()))
+    pairs = np.concatenate((right, up))
+    pairs = np.concatenate((pairs, pairs[:, ::-1]))
+    order = np.lexsort((pairs[:, 1], pairs[:, 0]))
+    tails, heads = pairs[order, 0], pairs[order, 1]
+
+    tail_row, tail_col = np.divmod(tails, size)
+    head_row, head_col = np.divmod(heads, size)
+    on_primary = (((tail_row == head_row) & (tail_row % 10 == 0))
+                  | ((tail_col == head_col) & (tail_col % 10 == 0)))
+    highway = np.where(on_primary, HIGHWAY_CODES['primary'],
+                       HIGHWAY_CODES['residential']).astype(np.uint8)
+
+    bend = rng.normal(0, 0.1, len(tails))
+    mid_lat = (lat[tails] + lat[heads]) / 2 + bend * (lon[heads] - lon[tails])
+    mid_lon = (lon[tails] + lon[heads]) / 2 - bend * (lat[heads] - lat[tails])
+    geom = np.stack((np.column_stack((lat[tails], lon[tails])),
+                     np.column_stack((mid_lat, mid_lon)),
+                     np.column_stack((lat[heads], lon[heads]))), axis=1)
+    length = (haversine(lat[tails], lon[tails], mid_lat, mid_lon)
+              + haversine(mid_lat, mid_lon, lat[heads], lon[heads]))
+
+    indptr = np.zeros(size * size + 1, dtype=np.int64)
+    np.cumsum(np.bincount(tails, minlength=size * size), out=indptr[1:])
+    return CompiledGraph(
+        node_ids=np.arange(size * size, dtype=np.int64),
+        lat=lat, lon=lon, indptr=indptr,
+        heads=heads.astype(np.int64), length=length,
+        geom_offsets=np.arange(len(tails) + 1, dtype=np.int64) * 3,
+        geom_coords=geom.reshape(-1, 2),
+        highway=highway,
+        maxspeed=np.full(len(tails), np.nan, dtype=np.float32),
+    )
+
+
+def random_pairs(graph, count, seed=0):
+    """Reproducible (source, target) node positions"""
+    rng = random.Random(seed)
+    return [(rng.randrange(graph.num_nodes), rng.randrange(graph.num_nodes))
+            for _ in range(count)]
+
+
+def gps_traces(graph, count, spacing=30.0, noise=8.0, seed=0):
+    """Noisy GPS traces sampled every ``spacing`` metres along random routes"""
+    rng = np.random.default_rng(seed)
+    traces = []
+    for source, target in random_pairs(graph, count * 2, seed):
+        route = shortest_path(graph, source, target)
+        if route is None or len(route.edges) < 5:
+            continue
+        line = graph.search_geometry(route)
+        step = haversine(line[:-1, 0], line[:-1, 1], line[1:, 0], line[1:, 1])
+        along = np.concatenate(([0.0], np.cumsum(step)))
+        at = np.arange(0, along[-1], spacing)
+        lat = np.interp(at, along, line[:, 0])
+        lon = np.interp(at, along, line[:, 1])
+        lat += rng.normal(0, noise / 111320.0, len(at))
+        lon += rng.normal(0, noise / (111320.0 * math.cos(math.radians(lat[0]))),
+                          len(at))
+        traces.append(list(zip(lat.tolist(), lon.tolist())))
+        if len(traces) == count:
+            break
+    return traces
+
+
+def address_table(db_path, count=50000, seed=0):
+    """Fill an AddressDatabase-style ``addresses`` table with made-up streets"""
+    rng = random.Random(seed)
+    rows = set()
+    while len(rows) < count:
+        street = (f"{rng.randrange(1, 999)} {rng.choice(STREET_WORDS)} "
+                  f"{rng.choice(STREET_TYPES)} {rng.randrange(1, 40)}")
+        rows.add((street, rng.choice(CITIES)))
+    conn = sqlite3.connect(db_path)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS addresses (
+            id INTEGER PRIMARY KEY, street TEXT, city TEXT,
+            lat REAL, lon REAL, UNIQUE(street, city))
+    ''')
+    conn.executemany(
+        'INSERT OR REPLACE INTO addresses (street, city, lat, lon) '
+        'VALUES (?, ?, ?, ?)',
+        ((street, city, ORIGIN[0] + rng.random() * 0.2,
+          ORIGIN[1] + rng.random() * 0.2) for street, city in sorted(rows)))
+    conn.commit()
+    conn.close()
+
+
+def tile_table(db_path, zooms=(12, 13, 14, 15), span=16, tile_bytes=8192,
+               seed=0):
+    """MBTiles file with ``span`` x ``span`` random-content tiles per zoom"""
+    rng = np.random.default_rng(seed)
+    conn = sqlite3.connect(db_path)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS tiles (
+            zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER,
+            tile_data BLOB)
+    ''')
+    conn.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS tile_index
+        ON tiles (zoom_level, tile_column, tile_row)
+    ''')
+    for zoom in zooms:
+        x0 = int((ORIGIN[1] + 180) / 360 * 2 ** zoom)
+        y0 = 2 ** zoom - 1 - int((1 - math.asinh(math.tan(math.radians(
+            ORIGIN[0]))) / math.pi) / 2 * 2 ** zoom)
+        conn.executemany(
+            'INSERT OR REPLACE INTO tiles VALUES (?, ?, ?, ?)',
+            ((zoom, x0 + dx, y0 + dy, rng.bytes(tile_bytes))
+             for dx in range(span) for dy in range(span)))
+    conn.commit()
+    conn.close()
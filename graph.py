@@ -0,0 +1,299 @@
+import math
+import os
+import pickle
+import numpy as np
+import speeds
+
+
+class CompiledGraph:
+    """Array-backed copy of the road network.
+
+    Edges are stored in CSR order (grouped by tail node) so an edge id is just
+    its position in the arrays. Every edge's geometry is packed into one flat
+    coordinate array and sliced through ``geom_offsets``.
+
+    Travel times are precomputed for every speed-profile bucket as rows of
+    ``travel_time``; ``bucket_minutes`` maps each minute of the day to a row.
+    ``profiles_hash`` identifies the profiles and speed table they came from.
+    """
+
+    ARRAYS = ('node_ids', 'lat', 'lon', 'indptr', 'heads', 'length',
+              'geom_offsets', 'geom_coords', 'highway', 'maxspeed',
+              'travel_time', 'bucket_minutes', 'bucket_names',
+              'profiles_hash')
+
+    def __init__(self, node_ids, lat, lon, indptr, heads, length,
+                 geom_offsets, geom_coords, highway, maxspeed,
+                 travel_time=None, bucket_minutes=None, bucket_names=None,
+                 profiles_hash=None):
+        self.node_ids = node_ids
+        self.lat = lat
+        self.lon = lon
+        self.indptr = indptr
+        self.heads = heads
+        self.length = length
+        self.geom_offsets = geom_offsets
+        self.geom_coords = geom_coords
+        self.highway = highway
+        self.maxspeed = maxspeed
+
+        self.num_nodes = len(node_ids)
+        self.num_edges = len(heads)
+        self.tails = np.repeat(np.arange(self.num_nodes, dtype=np.int64),
+                               np.diff(indptr))
+        self.node_index = {node: i for i, node in enumerate(node_ids.tolist())}
+
+        # Shortest edge for every (tail, head) pair, sorted by a packed key so
+        # a whole path can be resolved to edge ids with one searchsorted call
+        order = np.lexsort((length, heads, self.tails))
+        keys = self.tails[order] * self.num_nodes + heads[order]
+        keys, first = np.unique(keys, return_index=True)
+        self.pair_keys = keys
+        self.pair_edges = order[first]
+
+        self._lists = {}
+        if travel_time is None:
+            self.apply_profiles(speeds.PROFILES)
+        else:
+            self._set_travel_time(travel_time, bucket_minutes, bucket_names,
+                                  str(profiles_hash))
+
+    def apply_profiles(self, profiles):
+        """Recompute the travel-time rows for a new set of speed profiles"""
+        self._set_travel_time(
+            speeds.travel_times(self.highway, self.maxspeed, self.length,
+                                profiles),
+            speeds.bucket_minutes(profiles),
+            np.array([profile['name'] for profile in profiles]),
+            speeds.profiles_hash(profiles))
+
+    def _set_travel_time(self, travel_time, bucket_minutes, bucket_names,
+                         profiles_hash):
+        self.travel_time = travel_time
+        self.profiles_hash = profiles_hash
+        self.bucket_minutes = bucket_minutes
+        self.bucket_names = bucket_names
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.max_speed_mps = float(np.nanmax(self.length / travel_time))
+        self._lists.pop('travel_time', None)
+        self._lists.pop('bucket_minutes', None)
+
+    def bucket_at(self, seconds):
+        """Speed-profile bucket in effect ``seconds`` after midnight"""
+        minute = int(seconds // 60) % speeds.MINUTES_PER_DAY
+        return int(self.bucket_minutes[minute])
+
+    def _as_list(self, name, array):
+        if name not in self._lists:
+            self._lists[name] = array.tolist()
+        return self._lists[name]
+
+    def weight_array(self, weight):
+        """Per-edge cost array for a weight name"""
+        return getattr(self, weight)
+
+    def heuristic_scale(self, weight):
+        """Factor turning straight-line metres into a lower bound on ``weight``"""
+        if weight == 'travel_time':
+            return 1.0 / self.max_speed_mps
+        return 1.0
+
+    def adjacency(self, weight='length'):
+        """Python-list view of the CSR arrays used by the search loops.
+
+        For ``travel_time`` the weights are one list per profile bucket.
+        """
+        return (self._as_list('indptr', self.indptr),
+                self._as_list('heads', self.heads),
+                self._as_list(weight, self.weight_array(weight)))
+
+    def reverse_adjacency(self):
+        """Incoming edges of every node as lists: (indptr, tails, edge ids)"""
+        if 'reverse_edges' not in self._lists:
+            order = np.argsort(self.heads, kind='stable')
+            indptr = np.zeros(self.num_nodes + 1, dtype=np.int64)
+            np.cumsum(np.bincount(self.heads, minlength=self.num_nodes),
+                      out=indptr[1:])
+            self._lists['reverse_indptr'] = indptr.tolist()
+            self._lists['reverse_tails'] = self.tails[order].tolist()
+            self._lists['reverse_edges'] = order.tolist()
+        return (self._lists['reverse_indptr'], self._lists['reverse_tails'],
+                self._lists['reverse_edges'])
+
+    def tails_list(self):
+        return self._as_list('tails', self.tails)
+
+    def bucket_minutes_list(self):
+        return self._as_list('bucket_minutes', self.bucket_minutes)
+
+    def save(self, path):
+        """Write the arrays to an uncompressed .npz file"""
+        with open(path, 'wb') as f:
+            np.savez(f, **{name: getattr(self, name) for name in self.ARRAYS})
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            arrays = {name: data[name] for name in cls.ARRAYS[:-1]}
+            # Caches written before the hash was stored are recomputed
+            if 'profiles_hash' in data.files:
+                arrays['profiles_hash'] = data['profiles_hash']
+        return cls(**arrays)
+
+    def nearest(self, lat, lon):
+        """Position of the node closest to a point"""
+        dlat = self.lat - lat
+        dlon = (self.lon - lon) * math.cos(math.radians(lat))
+        return int(np.argmin(dlat * dlat + dlon * dlon))
+
+    def node_indices(self, route):
+        """Map a list of graph node ids to array positions"""
+        return np.fromiter((self.node_index[node] for node in route),
+                           dtype=np.int64, count=len(route))
+
+    def path_edges(self, path):
+        """Edge ids joining consecutive node positions of a path"""
+        path = np.asarray(path, dtype=np.int64)
+        keys = path[:-1] * self.num_nodes + path[1:]
+        return self.pair_edges[np.searchsorted(self.pair_keys, keys)]
+
+    def edge_geometry(self, edges):
+        """Concatenate the packed geometry of consecutive edges.
+
+        The last point of each edge is the first point of the next one, so it
+        is dropped everywhere except on the final edge.
+        """
+        edges = np.asarray(edges, dtype=np.int64)
+        starts = self.geom_offsets[edges]
+        counts = self.geom_offsets[edges + 1] - starts
+        counts[:-1] -= 1
+        shift = np.repeat(starts - (np.cumsum(counts) - counts), counts)
+        return self.geom_coords[np.arange(counts.sum()) + shift]
+
+    def path_geometry(self, path):
+        """Full ``(lat, lon)`` polyline for a path given as node positions"""
+        path = np.asarray(path, dtype=np.int64)
+        if len(path) < 2:
+            return np.column_stack((self.lat[path], self.lon[path]))
+        return self.edge_geometry(self.path_edges(path))
+
+    def search_geometry(self, route):
+        """Polyline of a search.Route, following the exact edges it used"""
+        if not route.edges:
+            return self.path_geometry(route.nodes)
+        return self.edge_geometry(route.edges)
+
+    def route_geometry(self, route):
+        """Full ``(lat, lon)`` polyline for a path of graph node ids"""
+        return self.path_geometry(self.node_indices(route))
+
+
+def _linestring_coords(geometry):
+    """(x, y) pairs of a shapely LineString or its WKT text"""
+    if hasattr(geometry, 'coords'):
+        return list(geometry.coords)
+    body = geometry[geometry.index('(') + 1:geometry.rindex(')')]
+    return [tuple(float(v) for v in point.split()[:2])
+            for point in body.split(',')]
+
+
+def compile_graph(G, profiles=None):
+    """Pack a NetworkX/OSMnx road graph into a CompiledGraph"""
+    nodes = list(G.nodes)
+    position = {node: i for i, node in enumerate(nodes)}
+    lat = np.array([G.nodes[node]['y'] for node in nodes], dtype=np.float64)
+    lon = np.array([G.nodes[node]['x'] for node in nodes], dtype=np.float64)
+
+    tails, heads, length, highway, maxspeed, geometries = [], [], [], [], [], []
+    for u, v, data in G.edges(data=True):
+        u, v = position[u], position[v]
+        tails.append(u)
+        heads.append(v)
+        length.append(float(data.get('length', 0.0)))
+        highway.append(speeds.highway_code(data.get('highway')))
+        maxspeed.append(speeds.parse_maxspeed(data.get('maxspeed')))
+        if 'geometry' in data:
+            geometries.append([(y, x) for x, y in
+                               _linestring_coords(data['geometry'])])
+        else:
+            geometries.append([(lat[u], lon[u]), (lat[v], lon[v])])
+
+    tails = np.array(tails, dtype=np.int64)
+    order = np.argsort(tails, kind='stable')
+    indptr = np.zeros(len(nodes) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(tails, minlength=len(nodes)), out=indptr[1:])
+
+    counts = np.array([len(geometries[e]) for e in order], dtype=np.int64)
+    geom_offsets = np.zeros(len(order) + 1, dtype=np.int64)
+    np.cumsum(counts, out=geom_offsets[1:])
+    geom_coords = np.array([point for e in order for point in geometries[e]],
+                           dtype=np.float64).reshape(-1, 2)
+
+    compiled = CompiledGraph(
+        node_ids=np.array(nodes),
+        lat=lat,
+        lon=lon,
+        indptr=indptr,
+        heads=np.array(heads, dtype=np.int64)[order],
+        length=np.array(length, dtype=np.float64)[order],
+        geom_offsets=geom_offsets,
+        geom_coords=geom_coords,
+        highway=np.array(highway, dtype=np.uint8)[order],
+        maxspeed=np.array(maxspeed, dtype=np.float32)[order],
+    )
+    if profiles is not None:
+        compiled.apply_profiles(profiles)
+    return compiled
+
+
+def compiled_path(source_path):
+    return source_path + '.npz'
+
+
+def _current_profiles(compiled, cache):
+    """Recompute stale travel times, rewriting ``cache`` when given"""
+    if compiled.profiles_hash == speeds.profiles_hash(speeds.PROFILES):
+        return compiled
+    compiled.apply_profiles(speeds.PROFILES)
+    if cache is not None:
+        try:
+            compiled.save(cache)
+        except OSError as e:
+            print(f"Error caching compiled graph: {e}")
+    return compiled
+
+
+def load_compiled(source_path, G=None):
+    """Load the compiled arrays cached next to a graph file.
+
+    The cache is rebuilt when it is missing or older than the source graph,
+    which is either a GraphML file or a pickled graph (``.pkl``). ``G`` may
+    be passed when the caller has already loaded the graph. A ``.npz`` path
+    is loaded as it is. Travel times computed from other speed profiles or
+    free-flow speeds than speeds.PROFILES and speeds.FREE_FLOW_KPH are
+    recomputed, and the cache rewritten.
+    """
+    if source_path.endswith('.npz'):
+        return _current_profiles(CompiledGraph.load(source_path), None)
+
+    cache = compiled_path(source_path)
+    if (os.path.exists(cache)
+            and os.path.getmtime(cache) >= os.path.getmtime(source_path)):
+        try:
+            return _current_profiles(CompiledGraph.load(cache), cache)
+        except KeyError:
+            # Written by an older version without some of the arrays
+            pass
+
+    if G is None and source_path.endswith('.pkl'):
+        with open(source_path, 'rb') as f:
+            G = pickle.load(f)
+    elif G is None:
+        import osmnx as ox
+        G = ox.load_graphml(source_path)
+    compiled = compile_graph(G)
+    try:
+        compiled.save(cache)
+    except OSError as e:
+        print(f"Error caching compiled graph: {e}")
+    return compiled
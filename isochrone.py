@@ -0,0 +1,189 @@
+import math
+
+import numpy as np
+
+import metrics
+from search import search_tree
+
+METRES_PER_DEGREE = 111320.0
+
+# Left turn, straight on, right turn: the order ring tracing tries them in
+_TURNS = ((lambda dx, dy: (-dy, dx)),
+          (lambda dx, dy: (dx, dy)),
+          (lambda dx, dy: (dy, -dx)))
+
+
+@metrics.timed('isochrone')
+def isochrones(graph, source, cutoffs, weight='length', departure=0.0,
+               cell_size=100.0, dilation=1):
+    """Reachability polygons around a node for several cutoffs at once.
+
+    One bounded Dijkstra runs up to the largest cutoff. Reached nodes and
+    edge geometry points are rasterised on a ``cell_size`` metre grid that
+    is grown by ``dilation`` cells, and the grid outline is traced into
+    rings. Cutoffs are in the units of ``weight`` (metres or seconds).
+    Returns a GeoJSON MultiPolygon geometry per cutoff, in cutoff order.
+    """
+    cutoffs = sorted(cutoffs)
+    tree = search_tree(graph, source, weight=weight, limit=cutoffs[-1],
+                       departure=departure)
+    points, costs = _reached_points(graph, tree, weight, departure)
+
+    lat0 = float(graph.lat[source])
+    dlat = cell_size / METRES_PER_DEGREE
+    dlon = cell_size / (METRES_PER_DEGREE * math.cos(math.radians(lat0)))
+    # Offset the cells by whole integers, not in degrees, so rounding can
+    # never eat into the empty border the tracing needs
+    pad = dilation + 1
+    min_lat, min_lon = points[:, 0].min(), points[:, 1].min()
+    origin_lat = min_lat - pad * dlat
+    origin_lon = min_lon - pad * dlon
+    rows = np.floor((points[:, 0] - min_lat) / dlat).astype(np.int64) + pad
+    cols = np.floor((points[:, 1] - min_lon) / dlon).astype(np.int64) + pad
+    shape = (rows.max() + pad + 1, cols.max() + pad + 1)
+
+    geometries = []
+    for cutoff in cutoffs:
+        within = costs <= cutoff
+        grid = np.zeros(shape, dtype=bool)
+        grid[rows[within], cols[within]] = True
+        grid = _dilate(grid, dilation)
+        polygons = [[[[origin_lon + x * dlon, origin_lat + y * dlat]
+                      for x, y in ring] for ring in polygon]
+                    for polygon in _polygons(_trace(grid))]
+        geometries.append({'type': 'MultiPolygon', 'coordinates': polygons})
+    return geometries
+
+
+def _reached_points(graph, tree, weight, departure):
+    """Coordinates and costs of reached nodes and of their edges' geometry.
+
+    A geometry point's cost is interpolated along its edge by point index,
+    which is close enough at grid resolution.
+    """
+    cost = np.full(graph.num_nodes, np.inf)
+    cost[tree.nodes] = tree.costs
+
+    edges = np.flatnonzero(np.isfinite(cost[graph.tails]))
+    start_cost = cost[graph.tails[edges]]
+    if weight == 'travel_time':
+        minutes = ((departure + start_cost) // 60).astype(np.int64)
+        buckets = graph.bucket_minutes[minutes % len(graph.bucket_minutes)]
+        edge_cost = graph.travel_time[buckets, edges]
+    else:
+        edge_cost = graph.weight_array(weight)[edges]
+
+    starts = graph.geom_offsets[edges]
+    counts = graph.geom_offsets[edges + 1] - starts
+    first = np.cumsum(counts) - counts
+    step = np.arange(counts.sum()) - np.repeat(first, counts)
+    fraction = step / np.repeat(np.maximum(counts - 1, 1), counts)
+
+    points = np.concatenate((
+        np.column_stack((graph.lat[tree.nodes], graph.lon[tree.nodes])),
+        graph.geom_coords[np.repeat(starts, counts) + step],
+    ))
+    costs = np.concatenate((
+        tree.costs,
+        np.repeat(start_cost, counts) + fraction * np.repeat(edge_cost, counts),
+    ))
+    return points, costs
+
+
+def _dilate(grid, cells):
+    for _ in range(cells):
+        grown = grid.copy()
+        grown[1:, :] |= grid[:-1, :]
+        grown[:-1, :] |= grid[1:, :]
+        grown[:, 1:] |= grid[:, :-1]
+        grown[:, :-1] |= grid[:, 1:]
+        grown[1:, 1:] |= grid[:-1, :-1]
+        grown[:-1, :-1] |= grid[1:, 1:]
+        grown[1:, :-1] |= grid[:-1, 1:]
+        grown[:-1, 1:] |= grid[1:, :-1]
+        grid = grown
+    return grid
+
+
+def _trace(grid):
+    """Outline of the filled cells as closed rings of (x, y) grid vertices.
+
+    Boundary edges are directed with the filled side on their left, so
+    outer rings come out counter-clockwise and holes clockwise. The grid
+    must have an empty border.
+    """
+    ys, xs = np.nonzero(grid[1:, :] & ~grid[:-1, :])
+    ys = ys + 1
+    segments = [((x, y), (1, 0)) for x, y in zip(xs.tolist(), ys.tolist())]
+    ys, xs = np.nonzero(grid[:-1, :] & ~grid[1:, :])
+    segments += [((x + 1, y + 1), (-1, 0))
+                 for x, y in zip(xs.tolist(), ys.tolist())]
+    ys, xs = np.nonzero(grid[:, 1:] & ~grid[:, :-1])
+    xs = xs + 1
+    segments += [((x, y + 1), (0, -1))
+                 for x, y in zip(xs.tolist(), ys.tolist())]
+    ys, xs = np.nonzero(grid[:, :-1] & ~grid[:, 1:])
+    segments += [((x + 1, y), (0, 1))
+                 for x, y in zip(xs.tolist(), ys.tolist())]
+
+    outgoing = {}
+    for start, direction in segments:
+        outgoing.setdefault(start, set()).add(direction)
+
+    rings = []
+    for start, direction in segments:
+        if direction not in outgoing.get(start, ()):
+            continue
+        ring = [start]
+        point = start
+        while True:
+            outgoing[point].discard(direction)
+            point = (point[0] + direction[0], point[1] + direction[1])
+            if point == start:
+                break
+            choices = outgoing[point]
+            for turn in _TURNS:
+                candidate = turn(*direction)
+                if candidate in choices:
+                    break
+            if candidate != direction:
+                ring.append(point)
+            direction = candidate
+        ring.append(start)
+        rings.append(ring)
+    return rings
+
+
+def _signed_area(ring):
+    return sum(x0 * y1 - x1 * y0
+               for (x0, y0), (x1, y1) in zip(ring, ring[1:])) / 2
+
+
+def _contains(ring, point):
+    x, y = point
+    inside = False
+    for (x0, y0), (x1, y1) in zip(ring, ring[1:]):
+        if (y0 > y) != (y1 > y) and x < x0 + (y - y0) * (x1 - x0) / (y1 - y0):
+            inside = not inside
+    return inside
+
+
+def _polygons(rings):
+    """Group grid rings into polygons, each outer ring followed by its holes"""
+    outers, holes = [], []
+    for ring in rings:
+        (outers if _signed_area(ring) > 0 else holes).append(ring)
+    outers.sort(key=_signed_area)
+
+    polygons = [[ring] for ring in outers]
+    for hole in holes:
+        # Probe just inside the hole, off its boundary, and give the hole to
+        # the smallest outer ring around that point
+        (x0, y0), (x1, y1) = hole[0], hole[1]
+        dx, dy = np.sign(x1 - x0), np.sign(y1 - y0)
+        probe = (x0 + dx * 0.5 + dy * 0.25, y0 + dy * 0.5 - dx * 0.25)
+        for polygon in polygons:
+            if _contains(polygon[0], probe):
+                polygon.append(hole)
+                break
+    return polygons
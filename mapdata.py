@@ -0,0 +1,466 @@
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from urllib.request import pathname2url
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import mapmatch
+import metrics
+import trip
+from alternatives import alternative_routes, MAX_OVERLAP, MAX_STRETCH
+from graph import load_compiled
+from isochrone import isochrones
+from partition import PartitionedGraph, partition_path, partition_ready
+from search import shortest_path, route_length, route_duration
+from speeds import seconds_of_day
+
+class ReadPool:
+    """Read-only connections to an SQLite file, shared through a queue.
+
+    sqlite3 connections must not be used by two threads at once, so a
+    reader checks one out for a ``with pool.connection() as conn:`` block
+    and hands it back at the end. A connection is only opened when all the
+    open ones are checked out, so there are never more than the readers
+    running at once, and at most ``max_idle`` are kept between uses. They
+    are opened read-only, with query_only set, memory-mapped I/O and a
+    larger page cache.
+    """
+    PRAGMAS = (
+        'PRAGMA query_only = ON',
+        'PRAGMA mmap_size = 268435456',
+        'PRAGMA cache_size = -16384',
+        'PRAGMA temp_store = MEMORY',
+    )
+    MAX_IDLE = 8
+    
+    def __init__(self, db_path, max_idle=MAX_IDLE):
+        # A read-only open fails on a missing file instead of creating it
+        if not os.path.exists(db_path):
+            raise FileNotFoundError(f"No such database: {db_path}")
+        self.uri = 'file:' + pathname2url(os.path.abspath(db_path)) + '?mode=ro'
+        self.idle = queue.Queue(max_idle)
+        self.lock = threading.Lock()
+        self.closed = False
+        
+    def _open(self):
+        # Not bound to one thread, as it moves between readers
+        conn = sqlite3.connect(self.uri, uri=True, check_same_thread=False)
+        for pragma in self.PRAGMAS:
+            conn.execute(pragma)
+        return conn
+    
+    @contextmanager
+    def connection(self):
+        """A connection of this block's own, returned to the pool after it"""
+        try:
+            conn = self.idle.get_nowait()
+        except queue.Empty:
+            conn = self._open()
+        try:
+            yield conn
+        finally:
+            with self.lock:
+                if self.closed or self.idle.full():
+                    conn.close()
+                else:
+                    self.idle.put_nowait(conn)
+    
+    def close(self):
+        """Close the idle connections, and the others as they come back"""
+        with self.lock:
+            self.closed = True
+            while not self.idle.empty():
+                self.idle.get_nowait().close()
+
+class AddressDatabase:
+    SEARCH = '''
+        SELECT street, city, lat, lon FROM addresses
+        WHERE street LIKE ? OR city LIKE ?
+    '''
+    
+    def __init__(self, db_path):
+        # Lookups, which also run on the routing worker thread, use pooled
+        # read-only connections. The pool comes first so that a missing
+        # file raises FileNotFoundError instead of being created below.
+        self.readers = ReadPool(db_path)
+        # Writes go through this connection
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.cursor = self.conn.cursor()
+        self.lock = threading.Lock()
+        self.setup_database()
+        
+    def setup_database(self):
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS addresses (
+                id INTEGER PRIMARY KEY,
+                street TEXT,
+                city TEXT,
+                lat REAL,
+                lon REAL,
+                UNIQUE(street, city)
+            )
+        ''')
+        self.conn.commit()
+        
+    def add_address(self, street, city, lat, lon):
+        try:
+            with self.lock:
+                self.cursor.execute('''
+                    INSERT OR REPLACE INTO addresses (street, city, lat, lon)
+                    VALUES (?, ?, ?, ?)
+                ''', (street, city, lat, lon))
+                self.conn.commit()
+        except sqlite3.Error as e:
+            print(f"Error adding address: {e}")
+            
+    @metrics.timed('geocode')
+    def search_address(self, query):
+        try:
+            pattern = f'%{query}%'
+            with self.readers.connection() as conn:
+                return conn.execute(self.SEARCH, (pattern, pattern)).fetchall()
+        except sqlite3.Error as e:
+            print(f"Error searching address: {e}")
+            return []
+    
+    @metrics.timed('geocode_batch')
+    def search_many(self, queries):
+        """search_address for several queries, one result list per query"""
+        try:
+            with self.readers.connection() as conn:
+                return [conn.execute(self.SEARCH,
+                                     (f'%{q}%', f'%{q}%')).fetchall()
+                        for q in queries]
+        except sqlite3.Error as e:
+            print(f"Error searching addresses: {e}")
+            return [[] for _ in queries]
+    
+    def close(self):
+        self.readers.close()
+        self.conn.close()
+
+class MapTileProvider:
+    TILE = '''
+        SELECT tile_data FROM tiles
+        WHERE zoom_level=? AND tile_column=? AND tile_row=?
+    '''
+    # Tiles looked up per statement by get_tiles; four parameters each must
+    # stay under SQLite's default limit of 999
+    BATCH = 200
+    
+    def __init__(self, db_path):
+        # Opened on the startup loader thread, read from the GUI thread and
+        # tile-serving threads through pooled connections. Raises
+        # FileNotFoundError for a missing file; the first connection is
+        # opened here so a file that is not SQLite fails here too.
+        self.readers = ReadPool(db_path)
+        with self.readers.connection():
+            pass
+        
+    @metrics.timed('tile_fetch')
+    def get_tile(self, zoom, x, y):
+        try:
+            with self.readers.connection() as conn:
+                row = conn.execute(self.TILE, (zoom, x, y)).fetchone()
+            return row[0] if row else None
+        except sqlite3.Error as e:
+            print(f"Error retrieving tile: {e}")
+            return None
+    
+    @metrics.timed('tile_fetch_batch')
+    def get_tiles(self, keys):
+        """Tile data for a list of (zoom, x, y), None for missing tiles.
+
+        Each chunk of keys is one join against an inline VALUES table, which
+        is much cheaper than one statement per tile.
+        """
+        tiles = [None] * len(keys)
+        try:
+            with self.readers.connection() as conn:
+                for first in range(0, len(keys), self.BATCH):
+                    chunk = keys[first:first + self.BATCH]
+                    rows = ','.join(['(?, ?, ?, ?)'] * len(chunk))
+                    params = [value for i, key in enumerate(chunk, first)
+                              for value in (i, *key)]
+                    for i, data in conn.execute(f'''
+                        WITH wanted(i, z, x, y) AS (VALUES {rows})
+                        SELECT wanted.i, tiles.tile_data FROM wanted
+                        JOIN tiles ON tiles.zoom_level = wanted.z
+                            AND tiles.tile_column = wanted.x
+                            AND tiles.tile_row = wanted.y
+                    ''', params):
+                        tiles[i] = data
+        except sqlite3.Error as e:
+            print(f"Error retrieving tiles: {e}")
+        return tiles
+    
+    def metadata(self):
+        """Name-value pairs of the MBTiles metadata table"""
+        try:
+            with self.readers.connection() as conn:
+                return dict(conn.execute(
+                    'SELECT name, value FROM metadata').fetchall())
+        except sqlite3.Error as e:
+            print(f"Error reading tile metadata: {e}")
+            return {}
+    
+    def close(self):
+        self.readers.close()
+
+@metrics.timed('route_summary')
+def route_summary(graph, route, depart):
+    """JSON-ready [lat, lon] geometry, metres and seconds of a search.Route.
+
+    ``graph`` is a CompiledGraph or the PartitionedGraph that found the route.
+    """
+    if isinstance(graph, PartitionedGraph):
+        duration = graph.route_duration(route, depart)
+    else:
+        duration = route_duration(graph, route, depart)
+    return {
+        'route': graph.search_geometry(route).tolist(),
+        'distance': route_length(graph, route),
+        'duration': duration,
+    }
+
+@metrics.timed('trip_summary')
+def trip_summary(graph, order, legs, roundtrip, depart):
+    """JSON-ready result of trip.plan_trip: order, geometry, totals, legs"""
+    summaries = trip.leg_summaries(graph, order, legs, roundtrip, depart)
+    geometry = [graph.search_geometry(leg) for leg in legs]
+    geometry = [g if i == 0 else g[1:] for i, g in enumerate(geometry)]
+    return {
+        'order': order,
+        'route': np.concatenate(geometry).tolist() if geometry else [],
+        'distance': sum(leg['distance'] for leg in summaries),
+        'duration': sum(leg['duration'] for leg in summaries),
+        'legs': summaries,
+    }
+
+class RoutingEngine:
+    # Route modes and the edge weight each one minimises
+    WEIGHTS = {'distance': 'length', 'time': 'travel_time'}
+    
+    def __init__(self, graph_path, profiles=None, workers=None,
+                 partitioned=False):
+        """Routing over the graph at ``graph_path``.
+
+        With ``partitioned``, single shortest routes are searched on the
+        multi-level partition next to the graph (partition.py) when one is
+        ready for the default speed profiles. The whole graph is then only
+        loaded once fastest routes, alternatives, isochrones, trips or map
+        matching need it. Fastest routes stay on the whole graph because the
+        partition prices a route with the speeds at departure throughout.
+        Points are then snapped through the partition's cells, without an
+        R-tree over every node.
+        """
+        self.graph_path = graph_path
+        self.profiles = profiles
+        self.workers = workers or os.cpu_count() or 1
+        self._executor = None
+        self._compiled = None
+        self._lock = threading.Lock()
+        self.partition = None
+        self.nodes = None
+        if partitioned and profiles is None and partition_ready(graph_path):
+            self.partition = PartitionedGraph(partition_path(graph_path))
+        else:
+            self.nodes = np.column_stack((self.compiled.lat, self.compiled.lon))
+        self._idx = None
+        self._G = None
+        self._matcher = None
+    
+    @property
+    def compiled(self):
+        """Compiled arrays of the whole graph, loaded on first access"""
+        if self._compiled is None:
+            with self._lock:
+                if self._compiled is None:
+                    # The GraphML is only parsed when the cache of these
+                    # arrays is missing or stale
+                    compiled = load_compiled(self.graph_path)
+                    if self.profiles is not None:
+                        compiled.apply_profiles(self.profiles)
+                    self._compiled = compiled
+        return self._compiled
+    
+    @property
+    def G(self):
+        """Full OSMnx graph, loaded on first access"""
+        if self._G is None:
+            import osmnx as ox
+            self._G = ox.load_graphml(self.graph_path)
+        return self._G
+    
+    @property
+    def idx(self):
+        """R-tree over the node positions, bulk-loaded on first access"""
+        if self._idx is None:
+            from rtree import index
+            self._idx = index.Index(
+                (i, (lat, lon, lat, lon), None)
+                for i, (lat, lon) in enumerate(self.nodes.tolist())
+            )
+        return self._idx
+    
+    @property
+    def executor(self):
+        """Process pool for the per-stop searches, started on first use"""
+        if self._executor is None and self.workers > 1:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(
+                        self.workers, initializer=trip.init_worker,
+                        initargs=(self.graph_path, self.profiles))
+        return self._executor
+    
+    def close(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown()
+        if self.partition is not None:
+            self.partition.close()
+    
+    def prepare(self):
+        """Build the lazy structures up front, e.g. on a loader thread"""
+        if self.partition is None:
+            for weight in self.WEIGHTS.values():
+                self.compiled.adjacency(weight)
+            self.idx
+    
+    @metrics.timed('snap')
+    def nearest_index(self, lat, lon):
+        if self.partition is not None:
+            return self.partition.nearest(lat, lon)
+        return list(self.idx.nearest((lat, lon, lat, lon), 1))[0]
+    
+    def nearest_node(self, lat, lon):
+        return self.compiled.node_ids[self.nearest_index(lat, lon)].item()
+    
+    def find_route(self, start_lat, start_lon, end_lat, end_lon,
+                   mode='distance', departure=None, progress=None):
+        """Best route between two points.
+
+        ``mode`` is 'distance' for the shortest route or 'time' for the
+        fastest one leaving at ``departure`` (datetime, time or seconds after
+        midnight; now when omitted). ``progress`` is called with the fraction
+        of the way covered while the search runs; raising from it aborts the
+        search. It is not called by searches on a partition. Returns a
+        dict with the [lat, lon] geometry, distance in metres and duration
+        in seconds, or None when there is no route.
+        """
+        weight = self.WEIGHTS[mode]
+        depart = seconds_of_day(departure)
+        start = self.nearest_index(start_lat, start_lon)
+        end = self.nearest_index(end_lat, end_lon)
+        
+        if self.partition is not None and weight == 'length':
+            graph = self.partition
+            route = graph.shortest_path(start, end, weight=weight,
+                                        departure=depart)
+        else:
+            graph = self.compiled
+            route = shortest_path(graph, start, end, weight=weight,
+                                  callback=progress, departure=depart)
+        if route is None:
+            return None
+        return route_summary(graph, route, depart)
+    
+    def find_routes(self, start_lat, start_lon, end_lat, end_lon,
+                    mode='distance', departure=None, count=3,
+                    max_overlap=MAX_OVERLAP, max_stretch=MAX_STRETCH,
+                    method='plateau'):
+        """The best route and up to ``count - 1`` different alternatives.
+
+        Alternatives cost at most ``max_stretch`` times the best route and
+        share at most ``max_overlap`` of their length with a better one;
+        ``method`` is 'plateau' or 'penalty' (see alternatives.py). Returns
+        a list of dicts like find_route's, best first; empty when there is
+        no route.
+        """
+        depart = seconds_of_day(departure)
+        start = self.nearest_index(start_lat, start_lon)
+        end = self.nearest_index(end_lat, end_lon)
+        routes = alternative_routes(self.compiled, start, end,
+                                    weight=self.WEIGHTS[mode], k=count,
+                                    max_overlap=max_overlap,
+                                    max_stretch=max_stretch,
+                                    departure=depart, method=method)
+        return [route_summary(self.compiled, route, depart) for route in routes]
+    
+    def calculate_route(self, start_lat, start_lon, end_lat, end_lon,
+                        progress=None, mode='distance', departure=None):
+        """Route between two points as a list of [lat, lon]"""
+        result = self.find_route(start_lat, start_lon, end_lat, end_lon,
+                                 mode, departure, progress)
+        return None if result is None else result['route']
+    
+    def calculate_alternatives(self, start_lat, start_lon, end_lat, end_lon,
+                               alternatives=2, mode='distance',
+                               departure=None):
+        """The best route and up to ``alternatives`` different ones.
+
+        Each route is a list of [lat, lon], best first; the list is empty
+        when there is no route.
+        """
+        return [result['route'] for result in self.find_routes(
+            start_lat, start_lon, end_lat, end_lon, mode, departure,
+            count=alternatives + 1)]
+    
+    def isochrones(self, lat, lon, cutoffs, mode='time', departure=None,
+                   cell_size=100.0):
+        """Areas reachable from a point within each cutoff.
+
+        Cutoffs are seconds for mode 'time' and metres for 'distance'.
+        Returns a GeoJSON MultiPolygon geometry per cutoff, smallest first.
+        """
+        source = self.nearest_index(lat, lon)
+        return isochrones(self.compiled, source, cutoffs,
+                          weight=self.WEIGHTS[mode],
+                          departure=seconds_of_day(departure),
+                          cell_size=cell_size)
+    
+    def optimize_stops(self, points, mode='distance', departure=None,
+                       roundtrip=False, time_budget=1.0):
+        """Visit a list of (lat, lon) stops in a short order, starting at the first.
+
+        With ``roundtrip`` the trip returns to the first stop. The order is
+        improved by local search for at most ``time_budget`` seconds.
+        Returns a dict with ``order`` (indices into ``points``), the stitched
+        [lat, lon] geometry, totals and per-leg distance and duration.
+        """
+        depart = seconds_of_day(departure)
+        stops = [self.nearest_index(lat, lon) for lat, lon in points]
+        # A handful of stops is quicker to route than to hand to the pool
+        executor = self.executor if len(stops) > 3 else None
+        order, legs = trip.plan_trip(self.compiled, stops,
+                                     weight=self.WEIGHTS[mode],
+                                     departure=depart, roundtrip=roundtrip,
+                                     time_budget=time_budget,
+                                     executor=executor)
+        
+        return trip_summary(self.compiled, order, legs, roundtrip, depart)
+    
+    @property
+    def matcher(self):
+        """GPS map matcher over the compiled graph, built on first use"""
+        if self._matcher is None:
+            self._matcher = mapmatch.MapMatcher(self.compiled)
+        return self._matcher
+    
+    def match_trace(self, points):
+        """Snap a GPS trace of (lat, lon) points onto the roads.
+
+        Returns a list of mapmatch.MatchedPoint; points with no road nearby
+        are left out. For a live feed use ``self.matcher.session()``.
+        """
+        return self.matcher.match(points)
+    
+    def match_traces(self, traces):
+        """Match many GPS traces across a pool of worker processes"""
+        if self.workers <= 1:
+            return [self.matcher.match(points) for points in traces]
+        return mapmatch.match_many(self.graph_path, traces, self.workers)
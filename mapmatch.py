@@ -0,0 +1,355 @@
+import math
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import metrics
+from graph import load_compiled
+from search import one_to_many
+
+METRES_PER_DEGREE = 111320.0
+
+MatchedPoint = namedtuple('MatchedPoint', [
+    'index',           # position of the GPS point in its trace
+    'lat', 'lon',      # the point projected onto the road
+    'edge',            # edge id in the compiled graph
+    'offset',          # metres from the start of the edge
+    'route_distance',  # metres driven since the previous matched point
+])
+
+
+class SegmentIndex:
+    """Uniform grid over every straight segment of the packed edge geometry.
+
+    Coordinates are flattened to metres around the graph's mean latitude,
+    which is accurate enough within a city.
+    """
+
+    def __init__(self, graph, cell_size=100.0):
+        self.cell_size = cell_size
+        self.ky = METRES_PER_DEGREE
+        self.kx = METRES_PER_DEGREE * math.cos(math.radians(graph.lat.mean()))
+
+        xy = self.to_xy(graph.geom_coords[:, 0], graph.geom_coords[:, 1])
+        last_point = np.zeros(len(xy), dtype=bool)
+        last_point[graph.geom_offsets[1:] - 1] = True
+        starts = np.flatnonzero(~last_point)
+
+        self.a = xy[starts]
+        self.b = xy[starts + 1]
+        self.edge = np.searchsorted(graph.geom_offsets, starts,
+                                    side='right') - 1
+        seg_length = np.hypot(*(self.b - self.a).T)
+        before = np.cumsum(seg_length) - seg_length
+        first = np.searchsorted(self.edge, self.edge, side='left')
+        # Metres from the start of the edge to the start of each segment
+        self.offset = before - before[first]
+        self.edge_length = np.bincount(self.edge, seg_length,
+                                       minlength=graph.num_edges)
+
+        # Every segment is listed under each cell its bounding box touches
+        low = np.floor(np.minimum(self.a, self.b) / cell_size).astype(np.int64)
+        high = np.floor(np.maximum(self.a, self.b) / cell_size).astype(np.int64)
+        self.origin = low.min(axis=0)
+        low -= self.origin
+        high -= self.origin
+        self.columns = int(high[:, 0].max()) + 1
+        width = high[:, 0] - low[:, 0] + 1
+        count = width * (high[:, 1] - low[:, 1] + 1)
+        segment = np.repeat(np.arange(len(count)), count)
+        step = np.arange(count.sum()) - np.repeat(np.cumsum(count) - count,
+                                                  count)
+        cx = low[segment, 0] + step % width[segment]
+        cy = low[segment, 1] + step // width[segment]
+        keys = cy * self.columns + cx
+        order = np.argsort(keys, kind='stable')
+        self.cell_keys, first = np.unique(keys[order], return_index=True)
+        self.cell_offsets = np.append(first, len(order))
+        self.cell_segments = segment[order]
+
+    def to_xy(self, lat, lon):
+        return np.column_stack((np.asarray(lon) * self.kx,
+                                np.asarray(lat) * self.ky))
+
+    def to_latlon(self, x, y):
+        return y / self.ky, x / self.kx
+
+    def candidates(self, x, y, radius, limit):
+        """Closest point of up to ``limit`` edges within ``radius`` metres.
+
+        Returns arrays of edge ids, offsets along the edge, distances and
+        projected x/y, nearest first.
+        """
+        low = np.floor((np.array([x, y]) - radius) / self.cell_size)
+        high = np.floor((np.array([x, y]) + radius) / self.cell_size)
+        low = low.astype(np.int64) - self.origin
+        high = high.astype(np.int64) - self.origin
+        low[0] = max(low[0], 0)
+        high[0] = min(high[0], self.columns - 1)
+        keys = [cy * self.columns + cx
+                for cy in range(max(low[1], 0), high[1] + 1)
+                for cx in range(low[0], high[0] + 1)]
+        if not keys:
+            return None
+        keys = np.array(keys)
+        at = np.minimum(np.searchsorted(self.cell_keys, keys),
+                        len(self.cell_keys) - 1)
+        at = at[self.cell_keys[at] == keys]
+        if not len(at):
+            return None
+        segments = np.unique(np.concatenate(
+            [self.cell_segments[self.cell_offsets[i]:self.cell_offsets[i + 1]]
+             for i in at]))
+
+        a, b = self.a[segments], self.b[segments]
+        ab = b - a
+        denom = np.maximum((ab * ab).sum(axis=1), 1e-12)
+        t = np.clip(((np.array([x, y]) - a) * ab).sum(axis=1) / denom, 0, 1)
+        proj = a + ab * t[:, None]
+        dist = np.hypot(proj[:, 0] - x, proj[:, 1] - y)
+
+        near = dist <= radius
+        if not near.any():
+            return None
+        segments, t, proj, dist = segments[near], t[near], proj[near], dist[near]
+        order = np.argsort(dist, kind='stable')
+        edges = self.edge[segments[order]]
+        # Keep the nearest projection onto each edge
+        _, first = np.unique(edges, return_index=True)
+        best = order[np.sort(first)][:limit]
+        seg = segments[best]
+        offset = self.offset[seg] + t[best] * np.sqrt(
+            (ab[best] * ab[best]).sum(axis=1))
+        return self.edge[seg], offset, dist[best], proj[best, 0], proj[best, 1]
+
+
+class MapMatcher:
+    """Hidden-Markov-model map matcher over a CompiledGraph.
+
+    Candidates for a GPS point are the nearest points of the edges within
+    ``radius`` metres. Emissions are Gaussian in the GPS error (``sigma``);
+    transitions are exponential in the difference between the driven and
+    the straight-line distance (``beta``). Driven distances between nodes
+    come from bounded searches and are kept in an LRU cache.
+    """
+
+    def __init__(self, graph, sigma=10.0, beta=50.0, radius=50.0,
+                 max_candidates=8, cache_size=200000, max_pending=64):
+        self.graph = graph
+        self.index = SegmentIndex(graph)
+        self.sigma = sigma
+        self.beta = beta
+        self.radius = radius
+        self.max_candidates = max_candidates
+        self.cache_size = cache_size
+        self.max_pending = max_pending
+        self._cache = OrderedDict()
+        self.heads = graph.heads
+        self.tails = graph.tails
+
+    def session(self):
+        """A streaming match that takes one GPS point at a time"""
+        return MatchSession(self)
+
+    @metrics.timed('map_match')
+    def match(self, points):
+        """Match a whole trace of (lat, lon) points"""
+        session = self.session()
+        matched = []
+        for lat, lon in points:
+            matched += session.push(lat, lon)
+        return matched + session.finish()
+
+    def node_distance(self, source, targets, limit):
+        """Driven metres from one node to several, cached.
+
+        A cached miss only counts when it was searched with at least the
+        same ``limit``.
+        """
+        result = {}
+        missing = []
+        for target in targets:
+            if source == target:
+                result[target] = 0.0
+                continue
+            hit = self._cache.get((source, target))
+            if hit is not None and (hit[0] < math.inf or hit[1] >= limit):
+                self._cache.move_to_end((source, target))
+                result[target] = hit[0]
+                metrics.cache('match_distance', True)
+            else:
+                missing.append(target)
+                metrics.cache('match_distance', False)
+        if missing:
+            costs = one_to_many(self.graph, source, missing, limit=limit)
+            for target, cost in zip(missing, costs):
+                result[target] = cost
+                self._cache[(source, target)] = (cost, limit)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return result
+
+    def transitions(self, prev, cur, straight):
+        """Log transition scores and driven distances between candidates"""
+        limit = straight * 2 + 2 * self.radius + 100
+        edge_length = self.index.edge_length
+        heads = {int(self.heads[e]) for e in prev['edge']}
+        targets = {int(self.tails[e]) for e in cur['edge']}
+        reach = {h: self.node_distance(h, targets, limit) for h in heads}
+
+        scores = np.full((len(prev['edge']), len(cur['edge'])), -math.inf)
+        driven = np.full(scores.shape, math.inf)
+        for i, (ea, oa) in enumerate(zip(prev['edge'], prev['offset'])):
+            rest = edge_length[ea] - oa
+            from_head = reach[int(self.heads[ea])]
+            for j, (eb, ob) in enumerate(zip(cur['edge'], cur['offset'])):
+                if ea == eb and ob >= oa:
+                    d = ob - oa
+                else:
+                    d = rest + from_head[int(self.tails[eb])] + ob
+                if d < math.inf:
+                    driven[i, j] = d
+                    scores[i, j] = -abs(d - straight) / self.beta
+        return scores, driven
+
+    def step(self, index, lat, lon):
+        """Candidates and emission scores for one GPS point, or None"""
+        x, y = self.index.to_xy(lat, lon)[0]
+        found = self.index.candidates(x, y, self.radius, self.max_candidates)
+        if found is None:
+            return None
+        edge, offset, dist, px, py = found
+        return {
+            'index': index, 'x': x, 'y': y,
+            'edge': edge, 'offset': offset, 'px': px, 'py': py,
+            'score': -0.5 * (dist / self.sigma) ** 2,
+            'back': np.full(len(edge), -1), 'driven': np.zeros(len(edge)),
+        }
+
+
+class MatchSession:
+    """Incremental Viterbi decoding.
+
+    ``push`` returns the points whose match can no longer change: once every
+    surviving candidate path shares an ancestor, everything up to that
+    ancestor is final. Points without a road within the search radius are
+    left out; when no candidate of a point can be reached from the previous
+    ones the path is cut and decoding starts afresh. If the candidates have
+    not converged after ``max_pending`` points, the current best path is
+    taken as final so memory stays bounded.
+    """
+
+    def __init__(self, matcher):
+        self.matcher = matcher
+        self.steps = []
+        self.count = 0
+        self.emitted = 0
+
+    def push(self, lat, lon):
+        index = self.count
+        self.count += 1
+        cur = self.matcher.step(index, lat, lon)
+        if cur is None:
+            return []
+        if not self.steps:
+            self.steps.append(cur)
+            return self._converged()
+
+        prev = self.steps[-1]
+        straight = math.hypot(cur['x'] - prev['x'], cur['y'] - prev['y'])
+        scores, driven = self.matcher.transitions(prev, cur, straight)
+        total = prev['score'][:, None] + scores
+        back = total.argmax(axis=0)
+        best = total[back, np.arange(len(back))]
+        if not np.isfinite(best).any():
+            flushed = self.finish()
+            self.steps = [cur]
+            return flushed + self._converged()
+
+        cur['score'] = best + cur['score']
+        cur['back'] = back
+        cur['driven'] = driven[back, np.arange(len(back))]
+        self.steps.append(cur)
+        return self._converged()
+
+    def finish(self):
+        """Decode whatever is still pending and reset the session"""
+        if not self.steps:
+            return []
+        last = self.steps[-1]
+        matched = self._backtrack(len(self.steps) - 1,
+                                  int(np.argmax(last['score'])))
+        self.steps = []
+        return matched
+
+    def _converged(self):
+        pos = len(self.steps) - 1
+        # Candidates no path reaches have no real back pointer to follow
+        score = self.steps[pos]['score']
+        alive = set(np.flatnonzero(np.isfinite(score)).tolist())
+        while len(alive) > 1:
+            if pos == 0:
+                if len(self.steps) <= self.matcher.max_pending:
+                    return []
+                pos = len(self.steps) - 1
+                alive = {int(np.argmax(self.steps[pos]['score']))}
+                break
+            alive = {int(self.steps[pos]['back'][j]) for j in alive}
+            pos -= 1
+        choice = alive.pop()
+        matched = self._backtrack(pos, choice)
+
+        # Keep the final step as the single-candidate root of what follows
+        root = self.steps[pos]
+        for key in ('edge', 'offset', 'px', 'py', 'score', 'back', 'driven'):
+            root[key] = root[key][choice:choice + 1]
+        root['emitted'] = True
+        if pos + 1 < len(self.steps):
+            self.steps[pos + 1]['back'] = np.zeros_like(
+                self.steps[pos + 1]['back'])
+        self.steps = self.steps[pos:]
+        return matched
+
+    def _backtrack(self, pos, choice):
+        matched = []
+        for step in reversed(self.steps[:pos + 1]):
+            if not step.get('emitted'):
+                lat, lon = self.matcher.index.to_latlon(step['px'][choice],
+                                                        step['py'][choice])
+                driven = step['driven'][choice] if step['back'][choice] >= 0 else 0.0
+                matched.append(MatchedPoint(
+                    step['index'], float(lat), float(lon),
+                    int(step['edge'][choice]), float(step['offset'][choice]),
+                    float(driven)))
+            choice = int(step['back'][choice])
+            if choice < 0:
+                break
+        matched.reverse()
+        return matched
+
+
+# Matcher of a worker process, built once by init_worker
+_matcher = None
+
+
+def init_worker(graph_path, options):
+    """Process-pool initializer: build the matcher once per worker"""
+    global _matcher
+    _matcher = MapMatcher(load_compiled(graph_path), **options)
+
+
+def _match_one(points):
+    return _matcher.match(points)
+
+
+def match_many(graph_path, traces, workers=None, **options):
+    """Match many traces of (lat, lon) points across a process pool.
+
+    ``graph_path`` is a graph file (or its compiled ``.npz``) that every
+    worker loads once; ``options`` go to MapMatcher. Results come back in
+    the order of ``traces``.
+    """
+    with ProcessPoolExecutor(workers, initializer=init_worker,
+                             initargs=(graph_path, options)) as pool:
+        return list(pool.map(_match_one, traces))
@@ -0,0 +1,224 @@
+"""Lightweight timings and counters, exported in Prometheus text format.
+
+Collection is off unless ``ROUTING_METRICS=1`` is set in the environment
+or ``enable()`` is called. While it is off, timed functions and stages
+cost one flag check and counters are not touched.
+
+Work done on a process pool records into the worker's own metrics. Run it
+through ``measured`` and pass what that returns to ``merge`` in the parent
+to count it there.
+"""
+import functools
+import os
+import threading
+import time
+from contextlib import nullcontext
+
+enabled = os.environ.get('ROUTING_METRICS', '') not in ('', '0')
+
+# Upper bounds in seconds of the histogram buckets
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+           0.5, 1.0, 2.5, 5.0, 10.0)
+
+_lock = threading.Lock()
+_registry = []
+_idle = nullcontext()
+
+
+def enable(on=True):
+    global enabled
+    enabled = on
+
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.values = {}
+        _registry.append(self)
+
+    def inc(self, amount=1, *labels):
+        with _lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def _merge(self, values):
+        for labels, value in values.items():
+            self.values[labels] = self.values.get(labels, 0) + value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}",
+                 f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} "
+                         f"{value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = buckets
+        # labels -> [count per bucket..., count of all, sum]
+        self.values = {}
+        _registry.append(self)
+
+    def observe(self, value, *labels):
+        with _lock:
+            counts = self.values.get(labels)
+            if counts is None:
+                counts = self.values[labels] = [0] * (len(self.buckets) + 1)
+                counts.append(0.0)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            counts[-2] += 1
+            counts[-1] += value
+
+    def _merge(self, values):
+        for labels, counts in values.items():
+            mine = self.values.get(labels)
+            if mine is None:
+                self.values[labels] = list(counts)
+            else:
+                self.values[labels] = [a + b for a, b in zip(mine, counts)]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}",
+                 f"# TYPE {self.name} histogram"]
+        names = self.labelnames + ('le',)
+        for labels, counts in sorted(self.values.items()):
+            for bound, count in zip(self.buckets, counts):
+                lines.append(f"{self.name}_bucket"
+                             f"{_labels(names, labels + (bound,))} {count}")
+            lines.append(f"{self.name}_bucket"
+                         f"{_labels(names, labels + ('+Inf',))} {counts[-2]}")
+            lines.append(f"{self.name}_count"
+                         f"{_labels(self.labelnames, labels)} {counts[-2]}")
+            lines.append(f"{self.name}_sum"
+                         f"{_labels(self.labelnames, labels)} {counts[-1]}")
+        return lines
+
+
+def _labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(f'{name}="{value}"' for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+STAGE_SECONDS = Histogram('routing_stage_seconds',
+                          "Time spent in each stage of request handling",
+                          ('stage',))
+NODES_SETTLED = Counter('routing_nodes_settled_total',
+                        "Nodes settled by graph searches", ('search',))
+SEARCHES = Counter('routing_searches_total', "Graph searches run",
+                   ('search',))
+CACHE = Counter('routing_cache_requests_total', "Cache lookups",
+                ('cache', 'result'))
+REQUESTS = Counter('routing_http_requests_total', "HTTP requests handled",
+                   ('endpoint', 'status'))
+REQUEST_SECONDS = Histogram('routing_http_request_seconds',
+                            "Time to handle an HTTP request", ('endpoint',))
+
+
+class _Stage:
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        STAGE_SECONDS.observe(time.perf_counter() - self.start, self.name)
+
+
+def stage(name):
+    """Context manager timing a block as stage ``name``"""
+    return _Stage(name) if enabled else _idle
+
+
+def timed(name):
+    """Decorator timing every call of a function as stage ``name``"""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                STAGE_SECONDS.observe(time.perf_counter() - start, name)
+        return wrapper
+    return decorate
+
+
+def searched(search, settled):
+    """Count one graph search and the nodes it settled"""
+    if enabled:
+        SEARCHES.inc(1, search)
+        NODES_SETTLED.inc(settled, search)
+
+
+def cache(name, hit):
+    """Count one lookup in cache ``name``"""
+    if enabled:
+        CACHE.inc(1, name, 'hit' if hit else 'miss')
+
+
+def request(endpoint, status, seconds):
+    """Count one HTTP request and its handling time"""
+    if enabled:
+        REQUESTS.inc(1, endpoint, status)
+        REQUEST_SECONDS.observe(seconds, endpoint)
+
+
+def collect():
+    """Take everything recorded so far in this process, leaving it empty"""
+    with _lock:
+        values = {}
+        for metric in _registry:
+            values[metric.name], metric.values = metric.values, {}
+    return values
+
+
+def reset():
+    """Drop everything recorded so far in this process.
+
+    Pool initializers call it, as forked workers start with a copy of the
+    parent's values.
+    """
+    collect()
+
+
+def merge(values):
+    """Add values returned by ``collect`` in another process to this one"""
+    with _lock:
+        for metric in _registry:
+            metric._merge(values.get(metric.name, {}))
+
+
+def measured(on, fn, *args):
+    """Call ``fn`` in a pool worker with collection switched ``on``.
+
+    Returns ``(result, values)`` with the values for ``merge`` in the
+    parent, which passes its own ``enabled`` flag as ``on``.
+    """
+    enable(on)
+    result = fn(*args)
+    return result, collect() if on else {}
+
+
+def render():
+    """Every metric in the Prometheus text exposition format"""
+    lines = []
+    with _lock:
+        for metric in _registry:
+            lines += metric.render()
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,628 @@
+"""Multi-level partition of the road network for routing large regions.
+
+``build_partition`` cuts a CompiledGraph into cells by recursive inertial
+bisection, groups the cells into coarser levels, and precomputes for every
+cell on every level the cost between each pair of its boundary nodes (the
+cell's clique). Everything is written to a directory of files.
+
+``PartitionedGraph`` answers queries from that directory with a
+multi-level Dijkstra: edges are searched one by one only inside the
+finest cells holding the start and the destination, and every other cell
+is crossed through its clique, on the coarsest level that contains
+neither end. Cells are read from disk when a query first touches them and
+kept in an LRU cache of ``max_cells`` entries; the per-node arrays and
+the edges between cells are memory-mapped, and snapping a point only reads
+the finest cells near it. A process therefore holds a bounded part of the
+network however large the region is: what still grows with the region is
+one bounding box per finest cell and the pages of the mapped files the
+operating system keeps in.
+"""
+import heapq
+import json
+import math
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import metrics
+import speeds
+from graph import load_compiled
+from search import EARTH_RADIUS_M, Route
+
+# Finest cells are split until they hold at most this many nodes
+MAX_CELL_NODES = 2000
+# Each level groups 2 ** LEVEL_BITS cells of the level below
+LEVEL_BITS = 3
+# Cells and cliques a PartitionedGraph keeps loaded at once
+MAX_CELLS = 256
+
+# Directions, in degrees east of north, tried for every bisection
+DIRECTIONS = (0, 45, 90, 135)
+METRES_PER_DEGREE = 111320.0
+
+# Edge costs kept per cell; travel_time has one row per speed-profile bucket
+METRICS = ('length', 'travel_time')
+
+# Per-node, per-edge and per-cell arrays memory-mapped by PartitionedGraph
+MAPPED = ('cells', 'lat', 'lon', 'heads', 'length', 'travel_time',
+          'geom_offsets', 'geom_coords', 'bucket_minutes', 'cell_boxes',
+          'cut_indptr', 'cut_heads', 'cut_edges', 'cut_length',
+          'cut_travel_time')
+
+# Layout of the files build_partition writes; older partitions are rebuilt
+FORMAT = 2
+
+
+def bisect(graph, max_cell_nodes=MAX_CELL_NODES):
+    """Finest cell of every node, and the depth of the bisection.
+
+    Every cell is split at the median of its nodes projected on one of
+    DIRECTIONS, choosing per cell the direction that cuts the fewest edges.
+    All cells of a depth are split at once, so each round is a few passes
+    over the node and edge arrays.
+    """
+    n = graph.num_nodes
+    depth = 0
+    while (n >> depth) > max_cell_nodes:
+        depth += 1
+    y = graph.lat * METRES_PER_DEGREE
+    x = (graph.lon * METRES_PER_DEGREE
+         * math.cos(math.radians(float(graph.lat.mean()))))
+    tails, heads = graph.tails, graph.heads
+
+    cell = np.zeros(n, dtype=np.int64)
+    for d in range(depth):
+        cells = 1 << d
+        inside = cell[tails] == cell[heads]
+        sizes = np.bincount(cell, minlength=cells)
+        starts = np.cumsum(sizes) - sizes
+        best_cut = np.full(cells, np.inf)
+        side = np.zeros(n, dtype=bool)
+        for angle in np.radians(DIRECTIONS):
+            order = np.lexsort((x * math.sin(angle) + y * math.cos(angle),
+                                cell))
+            rank = np.empty(n, dtype=np.int64)
+            rank[order] = np.arange(n) - starts[cell[order]]
+            upper = rank >= sizes[cell] // 2
+            crossing = inside & (upper[tails] != upper[heads])
+            cut = np.bincount(cell[tails[crossing]], minlength=cells)
+            better = cut < best_cut
+            best_cut[better] = cut[better]
+            take = better[cell]
+            side[take] = upper[take]
+        cell = cell * 2 + side
+    return cell, depth
+
+
+def cell_levels(leaf, depth, level_bits=LEVEL_BITS):
+    """``(nodes, levels)`` cell ids, finest level first"""
+    shifts = list(range(0, max(depth, 1), level_bits))
+    return np.column_stack([leaf >> shift for shift in shifts]).astype(np.int32)
+
+
+def partition_path(source_path):
+    return source_path + '.cells'
+
+
+def _hops(source, target, parent):
+    """``(tail, head, hop)`` moves from ``source`` to ``target``, in order"""
+    hops = []
+    node = target
+    while node != source:
+        tail, hop = parent[node]
+        hops.append((tail, node, hop))
+        node = tail
+    hops.reverse()
+    return hops
+
+
+def _edge_costs(graph):
+    """Edge costs as float32 rows: length first, then every bucket's times"""
+    return np.vstack((graph.length[np.newaxis, :],
+                      graph.travel_time)).astype(np.float32)
+
+
+def _split_costs(costs):
+    return {'length': costs[:1], 'travel_time': costs[1:]}
+
+
+def _leaf_clique(nodes, heads, indptr, costs, boundary):
+    """Costs between the boundary nodes of a finest cell.
+
+    One Dijkstra per boundary node and cost row over the cell's own edges.
+    ``heads``/``indptr``/``costs`` are the out-edges of ``nodes`` in CSR
+    order; edges leaving the cell are skipped.
+    """
+    local = {node: i for i, node in enumerate(nodes)}
+    heads = [local.get(head, -1) for head in heads]
+    sources = [local[node] for node in boundary]
+    clique = np.full((len(costs), len(boundary), len(boundary)), np.inf,
+                     dtype=np.float32)
+    for row, weights in enumerate(costs.tolist()):
+        out = [[(heads[e], weights[e]) for e in range(indptr[i], indptr[i + 1])
+                if heads[e] >= 0] for i in range(len(nodes))]
+        for i, source in enumerate(sources):
+            dist = [math.inf] * len(nodes)
+            dist[source] = 0.0
+            heap = [(0.0, source)]
+            while heap:
+                d, u = heapq.heappop(heap)
+                if d > dist[u]:
+                    continue
+                for v, w in out[u]:
+                    nd = d + w
+                    if nd < dist[v]:
+                        dist[v] = nd
+                        heapq.heappush(heap, (nd, v))
+            clique[row, i] = [dist[node] for node in sources]
+    return clique
+
+
+def _overlay_clique(subcliques, cut_tails, cut_heads, cut_costs, boundary):
+    """Costs between the boundary nodes of a cell above the finest level.
+
+    The cell's graph is the cliques of its cells one level down, joined by
+    the edges running between them. It is small and dense, so all pairs are
+    solved at once with a vectorised Floyd-Warshall.
+    """
+    nodes = np.unique(np.concatenate([sub for sub, _ in subcliques]))
+    dist = np.full((len(cut_costs), len(nodes), len(nodes)), np.inf,
+                   dtype=np.float32)
+    for sub, clique in subcliques:
+        at = np.searchsorted(nodes, sub)
+        dist[:, at[:, np.newaxis], at] = clique
+    tails = np.searchsorted(nodes, cut_tails)
+    heads = np.searchsorted(nodes, cut_heads)
+    for row in range(len(cut_costs)):
+        np.minimum.at(dist[row], (tails, heads), cut_costs[row])
+    for k in range(len(nodes)):
+        np.minimum(dist, dist[:, :, k, np.newaxis] + dist[:, np.newaxis, k],
+                   out=dist)
+    at = np.searchsorted(nodes, boundary)
+    return dist[:, at[:, np.newaxis], at]
+
+
+def _boundaries(cells, tails, heads, level):
+    """``(cell, boundary nodes)`` of every cell on ``level`` with any.
+
+    A boundary node has an edge to or from another cell of the level.
+    """
+    crossing = cells[tails, level] != cells[heads, level]
+    boundary = np.unique(np.concatenate((tails[crossing], heads[crossing])))
+    owner = cells[boundary, level]
+    order = np.argsort(owner, kind='stable')
+    boundary, owner = boundary[order], owner[order]
+    starts = np.flatnonzero(np.diff(owner, prepend=-1))
+    return list(zip(owner[starts].tolist(), np.split(boundary, starts[1:])))
+
+
+@metrics.timed('partition_build')
+def build_partition(graph, path, max_cell_nodes=MAX_CELL_NODES,
+                    level_bits=LEVEL_BITS, workers=None):
+    """Partition a CompiledGraph and write the cells and cliques to ``path``.
+
+    The cliques of the finest cells are independent searches, spread over
+    ``workers`` processes (all CPUs by default).
+    """
+    workers = workers or os.cpu_count() or 1
+    os.makedirs(path, exist_ok=True)
+    leaf, depth = bisect(graph, max_cell_nodes)
+    cells = cell_levels(leaf, depth, level_bits)
+    costs = _edge_costs(graph)
+    tails, heads = graph.tails, graph.heads
+    boundaries = dict(_boundaries(cells, tails, heads, 0))
+
+    # Finest cells: the out-edges of their nodes in CSR order, cliques, and
+    # the bounding boxes snapping looks through (empty cells match nothing)
+    leaves, jobs = {}, []
+    boxes = np.tile([np.inf, np.inf, -np.inf, -np.inf], (1 << depth, 1))
+    order = np.argsort(leaf, kind='stable')
+    bounds = np.searchsorted(leaf[order], np.arange((1 << depth) + 1))
+    for cell in range(1 << depth):
+        nodes = order[bounds[cell]:bounds[cell + 1]]
+        if not len(nodes):
+            continue
+        starts = graph.indptr[nodes]
+        counts = graph.indptr[nodes + 1] - starts
+        indptr = np.zeros(len(nodes) + 1, dtype=np.int64)
+        np.cumsum(counts, out=indptr[1:])
+        edges = np.repeat(starts - indptr[:-1], counts) + np.arange(indptr[-1])
+        leaves[f'{cell}_nodes'] = nodes
+        boxes[cell] = (graph.lat[nodes].min(), graph.lon[nodes].min(),
+                       graph.lat[nodes].max(), graph.lon[nodes].max())
+        leaves[f'{cell}_indptr'] = indptr
+        leaves[f'{cell}_heads'] = heads[edges]
+        leaves[f'{cell}_edges'] = edges
+        for metric, rows in _split_costs(costs[:, edges]).items():
+            leaves[f'{cell}_{metric}'] = rows
+        if cell in boundaries:
+            jobs.append((cell, nodes.tolist(), heads[edges].tolist(),
+                         indptr.tolist(), costs[:, edges],
+                         boundaries[cell].tolist()))
+    if workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(workers) as pool:
+            results = list(pool.map(_leaf_clique, *list(zip(*jobs))[1:]))
+    else:
+        results = [_leaf_clique(*job[1:]) for job in jobs]
+    cliques = {(0, job[0]): (boundaries[job[0]], clique)
+               for job, clique in zip(jobs, results)}
+
+    # Every level up joins the cliques of the level below
+    cut = np.flatnonzero(leaf[tails] != leaf[heads])
+    cut_tails, cut_heads = tails[cut], heads[cut]
+    for level in range(1, cells.shape[1]):
+        parent = cells[:, level]
+        inside = ((parent[cut_tails] == parent[cut_heads])
+                  & (cells[cut_tails, level - 1] != cells[cut_heads, level - 1]))
+        below = {}
+        for (sublevel, _), entry in cliques.items():
+            if sublevel == level - 1:
+                below.setdefault(int(parent[entry[0][0]]), []).append(entry)
+        for cell, boundary in _boundaries(cells, tails, heads, level):
+            joins = inside & (parent[cut_tails] == cell)
+            cliques[level, cell] = (boundary, _overlay_clique(
+                below[cell], cut_tails[joins], cut_heads[joins],
+                costs[:, cut[joins]], boundary))
+
+    overlay = {}
+    for (level, cell), (boundary, clique) in cliques.items():
+        overlay[f'{level}_{cell}_nodes'] = boundary
+        for metric, rows in _split_costs(clique).items():
+            overlay[f'{level}_{cell}_{metric}'] = rows
+    np.savez(os.path.join(path, 'leaves.npz'), **leaves)
+    np.savez(os.path.join(path, 'overlay.npz'), **overlay)
+    cut_costs = _split_costs(costs[:, cut])
+    arrays = dict(cells=cells, lat=graph.lat, lon=graph.lon, heads=heads,
+                  length=graph.length,
+                  travel_time=graph.travel_time.astype(np.float32),
+                  geom_offsets=graph.geom_offsets,
+                  geom_coords=graph.geom_coords,
+                  bucket_minutes=graph.bucket_minutes, cell_boxes=boxes,
+                  cut_indptr=np.searchsorted(
+                      cut_tails, np.arange(graph.num_nodes + 1)),
+                  cut_heads=cut_heads, cut_edges=cut,
+                  cut_length=cut_costs['length'],
+                  cut_travel_time=cut_costs['travel_time'])
+    for name in MAPPED:
+        np.save(os.path.join(path, name + '.npy'), arrays[name])
+    # Written last: its presence marks a complete partition
+    with open(os.path.join(path, 'meta.json'), 'w') as f:
+        json.dump({'format': FORMAT,
+                   'nodes': graph.num_nodes, 'edges': graph.num_edges,
+                   'levels': cells.shape[1], 'depth': depth,
+                   'max_speed_mps': graph.max_speed_mps,
+                   'profiles_hash': graph.profiles_hash,
+                   'max_cell_nodes': max_cell_nodes,
+                   'level_bits': level_bits}, f)
+
+
+class PartitionedGraph:
+    """Routes over a partition written by ``build_partition``.
+
+    Shortest paths cost the same as ``search.shortest_path`` on the whole
+    graph. With ``weight='travel_time'`` the edges are costed with the
+    speed-profile bucket in effect at ``departure`` for the whole route,
+    since the cliques are precomputed per bucket.
+    """
+
+    def __init__(self, path, max_cells=MAX_CELLS):
+        self.path = path
+        self.max_cells = max_cells
+        with open(os.path.join(path, 'meta.json')) as f:
+            self.meta = json.load(f)
+        self.num_levels = self.meta['levels']
+        for name in MAPPED:
+            setattr(self, name, np.load(os.path.join(path, name + '.npy'),
+                                        mmap_mode='r'))
+        self.num_nodes = len(self.lat)
+        # Indexing a memoryview yields plain ints and floats, much faster
+        # than indexing the memory-mapped arrays in the search loops
+        self._cells = memoryview(self.cells)
+        self._lat = memoryview(self.lat)
+        self._lon = memoryview(self.lon)
+        # Edges between finest cells in CSR order by tail; one row of costs
+        # per speed-profile bucket, like the cells'
+        self._cut_indptr = memoryview(self.cut_indptr)
+        self._cut_heads = memoryview(self.cut_heads)
+        self._cut_edges = memoryview(self.cut_edges)
+        self._cut_weights = {
+            metric: [memoryview(row) for row in getattr(self, 'cut_' + metric)]
+            for metric in METRICS}
+
+        self.leaves = np.load(os.path.join(path, 'leaves.npz'))
+        self.overlay = np.load(os.path.join(path, 'overlay.npz'))
+        # (level, cell) -> loaded cell, level -1 for the finest cells' edges
+        self.loaded = OrderedDict()
+        self.lock = threading.Lock()
+
+    def close(self):
+        self.leaves.close()
+        self.overlay.close()
+        self.loaded.clear()
+
+    def cell_of(self, level, node):
+        return self._cells[node, level]
+
+    def _load(self, level, cell):
+        key = (level, cell)
+        with self.lock:
+            entry = self.loaded.get(key)
+            metrics.cache('cells', entry is not None)
+            if entry is not None:
+                self.loaded.move_to_end(key)
+                return entry
+            # Arrays stay packed; only the node index is a Python dict
+            if level < 0:
+                data, prefix = self.leaves, f'{cell}_'
+                entry = {name: memoryview(data[prefix + name])
+                         for name in ('nodes', 'indptr', 'heads', 'edges')}
+                for metric in METRICS:
+                    entry[metric] = [memoryview(costs)
+                                     for costs in data[prefix + metric]]
+            else:
+                data, prefix = self.overlay, f'{level}_{cell}_'
+                entry = {'nodes': data[prefix + 'nodes'].tolist()}
+                for metric in METRICS:
+                    entry[metric] = [[memoryview(costs) for costs in rows]
+                                     for rows in data[prefix + metric]]
+            entry['index'] = {node: i for i, node in enumerate(entry['nodes'])}
+            self.loaded[key] = entry
+            if len(self.loaded) > self.max_cells:
+                self.loaded.popitem(last=False)
+            return entry
+
+    def _edges(self, u, metric, row):
+        cell = self._load(-1, self.cell_of(0, u))
+        i = cell['index'][u]
+        heads, edges = cell['heads'], cell['edges']
+        weights = cell[metric][row]
+        for k in range(cell['indptr'][i], cell['indptr'][i + 1]):
+            yield heads[k], weights[k], edges[k]
+
+    def _moves(self, level, u, metric, row):
+        """``(head, cost, hop)`` of every move out of ``u`` on ``level``.
+
+        A hop is an edge id, or ``-1 - level`` for a shortcut through the
+        clique of ``u``'s cell on ``level``.
+        """
+        if level < 0:
+            yield from self._edges(u, metric, row)
+            return
+        clique = self._load(level, self.cell_of(level, u))
+        hop = -1 - level
+        costs = clique[metric][row][clique['index'][u]]
+        for v, cost in zip(clique['nodes'], costs):
+            if cost < math.inf and v != u:
+                yield v, cost, hop
+        yield from self._cut_moves(level, u, metric, row)
+
+    def _cut_moves(self, level, u, metric, row):
+        """Edges from ``u`` out of its cell on ``level``"""
+        first, last = self._cut_indptr[u], self._cut_indptr[u + 1]
+        if first < last:
+            own = self.cell_of(level, u)
+            heads, edges = self._cut_heads, self._cut_edges
+            weights = self._cut_weights[metric][row]
+            for k in range(first, last):
+                if self.cell_of(level, heads[k]) != own:
+                    yield heads[k], weights[k], edges[k]
+
+    def _potential(self, target, weight):
+        """A* heuristic: a lower bound on the cost from a node to ``target``.
+
+        Shortcut costs are costs of real paths, so the straight-line bound
+        holds for them as it does for single edges.
+        """
+        lat, lon = self._lat, self._lon
+        scale = (1.0 / self.meta['max_speed_mps']
+                 if weight == 'travel_time' else 1.0)
+        lat2, lon2 = math.radians(lat[target]), math.radians(lon[target])
+        cos2 = math.cos(lat2)
+        cache = {}
+
+        def h(node):
+            value = cache.get(node)
+            if value is None:
+                lat1, lon1 = math.radians(lat[node]), math.radians(lon[node])
+                a = (math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * cos2
+                     * math.sin((lon2 - lon1) / 2) ** 2)
+                value = cache[node] = (2 * EARTH_RADIUS_M * scale
+                                       * math.asin(min(1.0, math.sqrt(a))))
+            return value
+        return h
+
+    def _cell_search(self, level, cell, source, metric, row, target=None):
+        """Search from ``source`` inside ``cell`` of ``level``.
+
+        Moves on the level below, so a shortcut of the cell can be expanded,
+        and is goal-directed when there is a ``target``. Returns the costs and ``(node, hop)`` parents of the nodes reached.
+        """
+        h = (self._potential(target, metric) if target is not None
+             else lambda node: 0.0)
+        dist = {source: 0.0}
+        parent = {}
+        settled = set()
+        heap = [(h(source), 0.0, source)]
+        while heap:
+            _, d, u = heapq.heappop(heap)
+            if u in settled:
+                continue
+            settled.add(u)
+            if u == target:
+                break
+            for v, cost, hop in self._moves(level - 1, u, metric, row):
+                nd = d + cost
+                if nd < dist.get(v, math.inf) and self.cell_of(level, v) == cell:
+                    dist[v] = nd
+                    parent[v] = (u, hop)
+                    heapq.heappush(heap, (nd + h(v), nd, v))
+        metrics.searched('cell', len(settled))
+        return dist, parent
+
+    def _unpack(self, u, v, hop, metric, row):
+        """Edge ids of a move from ``u`` to ``v``, expanding shortcuts"""
+        if hop >= 0:
+            return [hop]
+        level = -1 - hop
+        _, parent = self._cell_search(level, self.cell_of(level, u), u,
+                                      metric, row, target=v)
+        edges = []
+        for a, b, inner in _hops(u, v, parent):
+            edges += self._unpack(a, b, inner, metric, row)
+        return edges
+
+    def bucket_at(self, seconds):
+        """Speed-profile bucket in effect ``seconds`` after midnight"""
+        minute = int(seconds // 60) % len(self.bucket_minutes)
+        return int(self.bucket_minutes[minute])
+
+    def nearest(self, lat, lon):
+        """Position of the node closest to a point.
+
+        Distances are in degrees, as RoutingEngine's R-tree measures them.
+        Finest cells are read nearest bounding box first, until no box is
+        closer than the best node found.
+        """
+        boxes = self.cell_boxes
+        dlat = np.maximum(np.maximum(boxes[:, 0] - lat, lat - boxes[:, 2]), 0)
+        dlon = np.maximum(np.maximum(boxes[:, 1] - lon, lon - boxes[:, 3]), 0)
+        gaps = dlat * dlat + dlon * dlon
+        best, best_gap = -1, math.inf
+        for cell in np.argsort(gaps).tolist():
+            if gaps[cell] >= best_gap:
+                break
+            nodes = np.asarray(self._load(-1, cell)['nodes'])
+            dist = (self.lat[nodes] - lat) ** 2 + (self.lon[nodes] - lon) ** 2
+            i = int(np.argmin(dist))
+            if dist[i] < best_gap:
+                best, best_gap = int(nodes[i]), float(dist[i])
+        return best
+
+    @metrics.timed('route_search')
+    def shortest_path(self, source, target, weight='length', departure=0.0):
+        """Multi-level A* search between two node positions.
+
+        Each settled node moves on the coarsest level whose cell contains
+        neither ``source`` nor ``target``, or along its own edges when no
+        such level exists. Shortcuts on the way are expanded into edges
+        afterwards. Returns a Route or None when the target cannot be
+        reached.
+        """
+        row = self.bucket_at(departure) if weight == 'travel_time' else 0
+        cells = self._cells
+        levels = range(self.num_levels - 1, -1, -1)
+        ends = [(cells[source, level], cells[target, level])
+                for level in range(self.num_levels)]
+
+        def query_level(node):
+            for level in levels:
+                if cells[node, level] not in ends[level]:
+                    return level
+            return -1
+
+        h = self._potential(target, weight)
+        dist = {source: 0.0}
+        parent = {}
+        settled = set()
+        heap = [(h(source), 0.0, source)]
+        while heap:
+            _, d, u = heapq.heappop(heap)
+            if u in settled:
+                continue
+            if u == target:
+                break
+            settled.add(u)
+            level = query_level(u)
+            if level >= 0:
+                # Shortcuts across the cell, inlined: this is the hot loop
+                clique = self._load(level, cells[u, level])
+                hop = -1 - level
+                costs = clique[weight][row][clique['index'][u]]
+                for v, cost in zip(clique['nodes'], costs):
+                    nd = d + cost
+                    if nd < dist.get(v, math.inf):
+                        dist[v] = nd
+                        parent[v] = (u, hop)
+                        heapq.heappush(heap, (nd + h(v), nd, v))
+                moves = self._cut_moves(level, u, weight, row)
+            else:
+                moves = self._edges(u, weight, row)
+            for v, cost, hop in moves:
+                nd = d + cost
+                if nd < dist.get(v, math.inf):
+                    dist[v] = nd
+                    parent[v] = (u, hop)
+                    heapq.heappush(heap, (nd + h(v), nd, v))
+        metrics.searched('multilevel', len(settled))
+        if target not in dist:
+            return None
+
+        edges = []
+        for a, b, hop in _hops(source, target, parent):
+            edges += self._unpack(a, b, hop, weight, row)
+        nodes = [source] + self.heads[edges].tolist()
+        return Route(dist[target], nodes, edges)
+
+    def route_length(self, route):
+        """Length of a Route in metres"""
+        return float(self.length[route.edges].sum())
+
+    def route_duration(self, route, departure=0.0):
+        """Seconds to drive a Route, like ``search.route_duration``"""
+        times = self.travel_time[:, route.edges].T.tolist()
+        bucket_minutes = self.bucket_minutes.tolist()
+        elapsed = 0.0
+        for row in times:
+            minute = int((departure + elapsed) // 60) % len(bucket_minutes)
+            elapsed += row[bucket_minutes[minute]]
+        return elapsed
+
+    def search_geometry(self, route):
+        """``(lat, lon)`` polyline of a Route, as CompiledGraph draws it"""
+        if not route.edges:
+            return np.column_stack((self.lat[route.nodes],
+                                    self.lon[route.nodes]))
+        edges = np.asarray(route.edges, dtype=np.int64)
+        starts = self.geom_offsets[edges]
+        counts = self.geom_offsets[edges + 1] - starts
+        counts[:-1] -= 1
+        shift = np.repeat(starts - (np.cumsum(counts) - counts), counts)
+        return self.geom_coords[np.arange(counts.sum()) + shift]
+
+
+def partition_ready(source_path):
+    """Whether the partition next to a graph file can be used as it is.
+
+    It must be complete, newer than the source graph, in the current
+    FORMAT, and built with the current speeds.PROFILES and free-flow speeds.
+    """
+    meta = os.path.join(partition_path(source_path), 'meta.json')
+    if (not os.path.exists(meta)
+            or os.path.getmtime(meta) < os.path.getmtime(source_path)):
+        return False
+    with open(meta) as f:
+        meta = json.load(f)
+    return (meta.get('format') == FORMAT and meta.get('profiles_hash')
+            == speeds.profiles_hash(speeds.PROFILES))
+
+
+def load_partition(source_path, max_cells=MAX_CELLS):
+    """Open the partition next to a graph file, building it when needed.
+
+    Like ``graph.load_compiled``, the partition is rebuilt when it is older
+    than the source graph or its travel times are stale.
+    """
+    path = partition_path(source_path)
+    if not partition_ready(source_path):
+        build_partition(load_compiled(source_path), path)
+    return PartitionedGraph(path, max_cells)
+
+
+if __name__ == '__main__':
+    import sys
+    for source in sys.argv[1:]:
+        load_partition(source).close()
+        print(f"Partitioned {source} into {partition_path(source)}")
@@ -0,0 +1,245 @@
+import heapq
+import math
+from collections import namedtuple
+
+import numpy as np
+
+import metrics
+
+EARTH_RADIUS_M = 6371009
+
+# How many settled nodes pass between two calls of a search callback
+CALLBACK_INTERVAL = 2048
+
+Route = namedtuple('Route', ['cost', 'nodes', 'edges'])
+Tree = namedtuple('Tree', ['nodes', 'costs', 'parent_edges'])
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """Great-circle distance in metres, broadcasting over numpy arrays"""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = (np.sin((lat2 - lat1) / 2) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
+
+
+def _unwind(source, target, parent_edge, tails):
+    edges = []
+    node = target
+    while node != source:
+        edge = parent_edge[node]
+        edges.append(edge)
+        node = tails[edge]
+    edges.reverse()
+    return edges
+
+
+@metrics.timed('route_search')
+def shortest_path(graph, source, target, weight='length', callback=None,
+                  departure=0.0, weights=None):
+    """A* search between two node positions of a CompiledGraph.
+
+    The straight-line distance to the target is the heuristic, so the search
+    settles far fewer nodes than plain Dijkstra. ``callback`` is called with
+    the fraction of the straight-line distance already covered every
+    ``CALLBACK_INTERVAL`` settled nodes; it may raise to abort the search.
+
+    With ``weight='travel_time'`` the search is time-dependent: edges leaving
+    a node are costed with the speed-profile bucket in effect when the node
+    is reached, counting from ``departure`` (seconds after midnight).
+    ``weights`` replaces the graph's edge costs for ``weight`` (same shape
+    as in ``graph.adjacency``); they must not be lower, or the heuristic
+    stops being a lower bound. Returns a Route or None when the target
+    cannot be reached.
+    """
+    indptr, heads, default_weights = graph.adjacency(weight)
+    if weights is None:
+        weights = default_weights
+    if weight == 'travel_time':
+        profile_weights = weights
+        bucket_minutes = graph.bucket_minutes_list()
+        minutes_per_day = len(bucket_minutes)
+    tails = graph.tails_list()
+    lat, lon = graph.lat, graph.lon
+    h = (haversine(lat, lon, lat[target], lon[target])
+         * graph.heuristic_scale(weight)).tolist()
+    h_source = h[source] or 1.0
+
+    dist = {source: 0.0}
+    parent_edge = {}
+    settled = set()
+    heap = [(h[source], 0.0, source)]
+    closest = h_source
+    while heap:
+        _, d, u = heapq.heappop(heap)
+        if u in settled:
+            continue
+        if u == target:
+            edges = _unwind(source, target, parent_edge, tails)
+            metrics.searched('astar', len(settled))
+            return Route(d, [source] + [heads[e] for e in edges], edges)
+        settled.add(u)
+        if weight == 'travel_time':
+            minute = int((departure + d) // 60) % minutes_per_day
+            weights = profile_weights[bucket_minutes[minute]]
+
+        if callback is not None:
+            closest = min(closest, h[u])
+            if len(settled) % CALLBACK_INTERVAL == 0:
+                callback(1.0 - closest / h_source)
+
+        for e in range(indptr[u], indptr[u + 1]):
+            v = heads[e]
+            nd = d + weights[e]
+            if nd < dist.get(v, math.inf):
+                dist[v] = nd
+                parent_edge[v] = e
+                heapq.heappush(heap, (nd + h[v], nd, v))
+    metrics.searched('astar', len(settled))
+    return None
+
+
+@metrics.timed('tree_search')
+def search_tree(graph, source, weight='length', limit=math.inf,
+                departure=0.0):
+    """Dijkstra from ``source`` settling every node costing at most ``limit``.
+
+    Returns a Tree of numpy arrays in settle order: node positions, their
+    costs and the edge each was reached by (-1 for the source).
+    """
+    indptr, heads, weights = graph.adjacency(weight)
+    if weight == 'travel_time':
+        profile_weights = weights
+        bucket_minutes = graph.bucket_minutes_list()
+        minutes_per_day = len(bucket_minutes)
+
+    dist = {source: 0.0}
+    parent_edge = {source: -1}
+    order, costs, parents = [], [], []
+    settled = set()
+    heap = [(0.0, source)]
+    while heap:
+        d, u = heapq.heappop(heap)
+        if u in settled:
+            continue
+        if d > limit:
+            break
+        settled.add(u)
+        order.append(u)
+        costs.append(d)
+        parents.append(parent_edge[u])
+        if weight == 'travel_time':
+            minute = int((departure + d) // 60) % minutes_per_day
+            weights = profile_weights[bucket_minutes[minute]]
+
+        for e in range(indptr[u], indptr[u + 1]):
+            v = heads[e]
+            nd = d + weights[e]
+            if nd < dist.get(v, math.inf):
+                dist[v] = nd
+                parent_edge[v] = e
+                heapq.heappush(heap, (nd, v))
+    metrics.searched('tree', len(settled))
+    return Tree(np.array(order, dtype=np.int64),
+                np.array(costs, dtype=np.float64),
+                np.array(parents, dtype=np.int64))
+
+
+@metrics.timed('matrix_search')
+def one_to_many(graph, source, targets, weight='length', departure=0.0,
+                limit=math.inf):
+    """Costs from ``source`` to every target in a single Dijkstra.
+
+    The search stops as soon as the last target is settled or the costs
+    pass ``limit``. Targets it did not reach cost ``math.inf``.
+    """
+    if limit < math.inf:
+        return _bounded_costs(graph, source, targets, weight, departure, limit)
+    indptr, heads, weights = graph.adjacency(weight)
+    if weight == 'travel_time':
+        profile_weights = weights
+        bucket_minutes = graph.bucket_minutes_list()
+        minutes_per_day = len(bucket_minutes)
+
+    # Dense arrays beat dicts here: these searches usually cover most of
+    # the graph before the last target is settled
+    remaining = set(targets)
+    dist = [math.inf] * graph.num_nodes
+    dist[source] = 0.0
+    settled = bytearray(graph.num_nodes)
+    heap = [(0.0, source)]
+    while heap and remaining:
+        d, u = heapq.heappop(heap)
+        if settled[u]:
+            continue
+        settled[u] = 1
+        remaining.discard(u)
+        if weight == 'travel_time':
+            minute = int((departure + d) // 60) % minutes_per_day
+            weights = profile_weights[bucket_minutes[minute]]
+
+        for e in range(indptr[u], indptr[u + 1]):
+            v = heads[e]
+            nd = d + weights[e]
+            if nd < dist[v]:
+                dist[v] = nd
+                heapq.heappush(heap, (nd, v))
+    if metrics.enabled:
+        metrics.searched('one_to_many', settled.count(1))
+    return [dist[target] if settled[target] else math.inf
+            for target in targets]
+
+
+def _bounded_costs(graph, source, targets, weight, departure, limit):
+    """one_to_many for a search that stays near ``source``.
+
+    Such searches settle few nodes, so dicts beat allocating arrays the
+    size of the graph on every call.
+    """
+    indptr, heads, weights = graph.adjacency(weight)
+    if weight == 'travel_time':
+        profile_weights = weights
+        bucket_minutes = graph.bucket_minutes_list()
+        minutes_per_day = len(bucket_minutes)
+
+    remaining = set(targets)
+    dist = {source: 0.0}
+    settled = set()
+    heap = [(0.0, source)]
+    while heap and remaining:
+        d, u = heapq.heappop(heap)
+        if u in settled:
+            continue
+        if d > limit:
+            break
+        settled.add(u)
+        remaining.discard(u)
+        if weight == 'travel_time':
+            minute = int((departure + d) // 60) % minutes_per_day
+            weights = profile_weights[bucket_minutes[minute]]
+
+        for e in range(indptr[u], indptr[u + 1]):
+            v = heads[e]
+            nd = d + weights[e]
+            if nd < dist.get(v, math.inf):
+                dist[v] = nd
+                heapq.heappush(heap, (nd, v))
+    metrics.searched('bounded', len(settled))
+    return [dist[target] if target in settled else math.inf
+            for target in targets]
+
+
+def route_length(graph, route):
+    """Length of a Route in metres"""
+    return float(graph.length[route.edges].sum())
+
+
+def route_duration(graph, route, departure=0.0):
+    """Seconds to drive a Route leaving ``departure`` seconds after midnight"""
+    _, _, profile_weights = graph.adjacency('travel_time')
+    bucket_minutes = graph.bucket_minutes_list()
+    elapsed = 0.0
+    for e in route.edges:
+        minute = int((departure + elapsed) // 60) % len(bucket_minutes)
+        elapsed += profile_weights[bucket_minutes[minute]][e]
+    return elapsed
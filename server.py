@@ -0,0 +1,304 @@
+"""Async routing service for production use.
+
+An ASGI application serving the same /route, /isochrone and /trip
+endpoints as app.py. The event loop only parses requests and snaps points;
+searches run on a process pool. Concurrent requests that snap to the same
+search share one computation, and when too many searches are queued new
+ones are turned away with 503 instead of piling up.
+
+Run it with any ASGI server, for example:
+
+    ROUTING_GRAPH=hyderabad.graphml uvicorn server:app --port 8000
+"""
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import parse_qs
+
+import api
+import metrics
+import trip
+from alternatives import alternative_routes
+from isochrone import isochrones
+from mapdata import RoutingEngine, route_summary, trip_summary
+from search import shortest_path
+from speeds import seconds_of_day
+
+GRAPHML_FILE = os.environ.get("ROUTING_GRAPH", "hyderabad.graphml")
+# Search single shortest routes on the graph's partition when one is ready
+PARTITIONED = os.environ.get("ROUTING_PARTITIONED", "1") not in ("", "0")
+
+# Searches queued or running at once; more are answered with 503
+MAX_PENDING = 64
+# Seconds a client is told to wait before retrying after a 503
+RETRY_AFTER = 1
+# Largest request body accepted, in bytes
+MAX_BODY = 1 << 20
+
+# Search jobs, run on worker processes set up by trip.init_worker
+
+def _route_job(start, end, weight, depart, alternatives, max_overlap,
+               max_stretch, method):
+    # Only shortest routes: the partition prices a fastest route with the
+    # speeds at departure throughout
+    graph = trip.worker_partition()
+    if alternatives == 0 and weight == "length" and graph is not None:
+        route = graph.shortest_path(start, end, weight=weight,
+                                    departure=depart)
+        routes = [] if route is None else [route]
+    elif alternatives == 0:
+        graph = trip.worker_graph()
+        route = shortest_path(graph, start, end, weight=weight,
+                              departure=depart)
+        routes = [] if route is None else [route]
+    else:
+        graph = trip.worker_graph()
+        routes = alternative_routes(graph, start, end, weight=weight,
+                                    k=alternatives + 1,
+                                    max_overlap=max_overlap,
+                                    max_stretch=max_stretch,
+                                    departure=depart, method=method)
+    return [route_summary(graph, route, depart) for route in routes]
+
+
+def _isochrone_job(source, cutoffs, weight, depart, cell_size):
+    return isochrones(trip.worker_graph(), source, cutoffs, weight=weight,
+                      departure=depart, cell_size=cell_size)
+
+
+def _trip_job(stops, weight, depart, roundtrip, time_budget):
+    graph = trip.worker_graph()
+    order, legs = trip.plan_trip(graph, list(stops), weight=weight,
+                                 departure=depart, roundtrip=roundtrip,
+                                 time_budget=time_budget)
+    return trip_summary(graph, order, legs, roundtrip, depart)
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message, headers=()):
+        super().__init__(message)
+        self.status = status
+        self.headers = list(headers)
+
+
+class RoutingService:
+    """ASGI application; see the module docstring"""
+
+    def __init__(self, graph_path, profiles=None, workers=None,
+                 max_pending=MAX_PENDING, partitioned=PARTITIONED):
+        self.graph_path = graph_path
+        self.profiles = profiles
+        self.partitioned = partitioned
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending
+        self.engine = None
+        self.executor = None
+        # Search key -> future of the search computing it
+        self.in_flight = {}
+        self.coalesced = 0
+        self.rejected = 0
+        self._starting = asyncio.Lock()
+        self.routes = {
+            "/route": (("GET",), self.route),
+            "/isochrone": (("GET",), self.isochrone),
+            "/trip": (("GET", "POST"), self.trip),
+            "/health": (("GET",), self.health),
+            "/metrics": (("GET",), self.export_metrics),
+        }
+
+    def start(self):
+        """Load the graph for snapping and start the worker processes"""
+        if self.engine is None:
+            # Only the snapping index lives in this process
+            engine = RoutingEngine(self.graph_path, self.profiles, workers=1,
+                                   partitioned=self.partitioned)
+            if engine.partition is None:
+                engine.idx  # bulk-load the R-tree now rather than on a request
+            self.executor = ProcessPoolExecutor(
+                self.workers, initializer=trip.init_worker,
+                initargs=(self.graph_path, self.profiles, self.partitioned))
+            self.engine = engine
+
+    def stop(self):
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+            self.executor = None
+        self.engine = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        elif scope["type"] == "http":
+            await self._http(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                try:
+                    await self._start()
+                except Exception as e:
+                    await send({"type": "lifespan.startup.failed",
+                                "message": str(e)})
+                    return
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.stop()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _start(self):
+        async with self._starting:
+            await asyncio.get_running_loop().run_in_executor(None, self.start)
+
+    async def _http(self, scope, receive, send):
+        start = time.perf_counter()
+        headers = []
+        try:
+            if self.engine is None:
+                # Servers without lifespan support start us on first use
+                await self._start()
+            methods, handler = self.routes.get(scope["path"], (None, None))
+            if handler is None:
+                raise HTTPError(404, f"Unknown endpoint: {scope['path']}")
+            if scope["method"] not in methods:
+                raise HTTPError(405, f"Method {scope['method']} not allowed",
+                                [("allow", ", ".join(methods))])
+            params = {k: v[-1] for k, v in parse_qs(
+                scope["query_string"].decode("latin-1")).items()}
+            if scope["method"] == "POST":
+                body = await self._read_body(receive)
+                if body:
+                    try:
+                        body = json.loads(body)
+                    except ValueError:
+                        raise HTTPError(400, "Request body is not valid JSON")
+                    if not isinstance(body, dict):
+                        raise HTTPError(
+                            400, "Request body must be a JSON object")
+                    params.update(body)
+            status, payload = 200, await handler(params)
+        except HTTPError as e:
+            status, payload, headers = e.status, {"error": str(e)}, e.headers
+        except api.BadRequest as e:
+            status, payload = 400, {"error": str(e)}
+        except Exception as e:
+            status, payload = 500, {"error": str(e)}
+
+        if isinstance(payload, str):
+            body = payload.encode()
+            content_type = b"text/plain; version=0.0.4"
+        else:
+            with metrics.stage("serialize"):
+                body = json.dumps(payload).encode()
+            content_type = b"application/json"
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", content_type),
+                        (b"content-length", str(len(body)).encode())]
+                       + [(k.encode(), v.encode()) for k, v in headers],
+        })
+        await send({"type": "http.response.body", "body": body})
+        endpoint = scope["path"] if scope["path"] in self.routes else "unknown"
+        metrics.request(endpoint, status, time.perf_counter() - start)
+
+    async def _read_body(self, receive):
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if len(body) > MAX_BODY:
+                raise HTTPError(413, "Request body too large")
+            if not message.get("more_body"):
+                return body
+
+    async def submit(self, key, job, *args):
+        """Run ``job`` on the pool, sharing it with identical searches.
+
+        A request whose ``key`` matches a search still in flight waits for
+        that one instead of starting its own. Raises a 503 HTTPError when
+        ``max_pending`` searches are already queued or running.
+        """
+        future = self.in_flight.get(key)
+        metrics.cache("in_flight", future is not None)
+        if future is not None:
+            self.coalesced += 1
+        else:
+            if len(self.in_flight) >= self.max_pending:
+                self.rejected += 1
+                raise HTTPError(503, "Too many requests in progress",
+                                [("retry-after", str(RETRY_AFTER))])
+            # The worker hands back the timings and search counters it
+            # recorded along with the result, to count them in /metrics
+            future = asyncio.get_running_loop().run_in_executor(
+                self.executor, metrics.measured, metrics.enabled, job, *args)
+            self.in_flight[key] = future
+            future.add_done_callback(lambda f: self._done(key, f))
+        # A client that goes away must not cancel the search for the others
+        result, _ = await asyncio.shield(future)
+        return result
+
+    def _done(self, key, future):
+        self.in_flight.pop(key, None)
+        if not future.cancelled() and future.exception() is None:
+            metrics.merge(future.result()[1])
+
+    def _weight(self, params):
+        return RoutingEngine.WEIGHTS[params["mode"]]
+
+    def _departure(self, params):
+        # Whole minutes, so requests made within the same minute coalesce
+        depart = seconds_of_day(params["departure"])
+        return depart - depart % 60
+
+    async def route(self, params):
+        params = api.route_params(params)
+        start = self.engine.nearest_index(*params["start"])
+        end = self.engine.nearest_index(*params["end"])
+        alternatives = params["alternatives"]
+
+        args = (start, end, self._weight(params), self._departure(params),
+                alternatives, params["max_overlap"], params["max_stretch"],
+                params["method"])
+        routes = await self.submit(("route",) + args, _route_job, *args)
+        if not routes:
+            raise HTTPError(404, "No path between these points")
+        if alternatives == 0:
+            return routes[0]
+        return dict(routes[0], alternatives=routes[1:])
+
+    async def isochrone(self, params):
+        params = api.isochrone_params(params)
+        source = self.engine.nearest_index(*params["point"])
+
+        args = (source, params["cutoffs"], self._weight(params),
+                self._departure(params), params["cell_size"])
+        geometries = await self.submit(("isochrone",) + args,
+                                       _isochrone_job, *args)
+        return api.isochrone_features(params["cutoffs"], geometries,
+                                      params["mode"])
+
+    async def trip(self, params):
+        params = api.trip_params(params)
+        stops = tuple(self.engine.nearest_index(lat, lon)
+                      for lat, lon in params["points"])
+
+        args = (stops, self._weight(params), self._departure(params),
+                params["roundtrip"], params["time_budget"])
+        try:
+            return await self.submit(("trip",) + args, _trip_job, *args)
+        except trip.Unreachable as e:
+            raise HTTPError(404, str(e))
+
+    async def export_metrics(self, params):
+        return metrics.render()
+
+    async def health(self, params):
+        return {"in_flight": len(self.in_flight),
+                "coalesced": self.coalesced, "rejected": self.rejected}
+
+
+app = RoutingService(GRAPHML_FILE)
@@ -0,0 +1,132 @@
+import hashlib
+import json
+import math
+import re
+from datetime import datetime, time as dtime
+
+import numpy as np
+
+# OSM highway classes we tell apart; anything else is treated as 'road'
+HIGHWAY_CLASSES = [
+    'motorway', 'motorway_link', 'trunk', 'trunk_link', 'primary',
+    'primary_link', 'secondary', 'secondary_link', 'tertiary',
+    'tertiary_link', 'unclassified', 'residential', 'living_street',
+    'service', 'road',
+]
+HIGHWAY_CODES = {name: code for code, name in enumerate(HIGHWAY_CLASSES)}
+
+# Free-flow speeds in km/h for Hyderabad city driving. A signed maxspeed
+# lower than these caps the edge; a higher one is ignored.
+FREE_FLOW_KPH = {
+    'motorway': 80, 'motorway_link': 50, 'trunk': 60, 'trunk_link': 40,
+    'primary': 50, 'primary_link': 35, 'secondary': 40, 'secondary_link': 30,
+    'tertiary': 35, 'tertiary_link': 25, 'unclassified': 30,
+    'residential': 25, 'living_street': 10, 'service': 15, 'road': 30,
+}
+
+# Time-of-day buckets. Each one scales the free-flow speed by a factor per
+# highway class ('default' covers the classes not listed; a *_link falls
+# back to its parent class). Hours are [start, end) in local time.
+PROFILES = [
+    {'name': 'night', 'hours': [[22, 24], [0, 6]],
+     'factors': {'default': 1.0}},
+    {'name': 'early_morning', 'hours': [[6, 8]],
+     'factors': {'default': 0.85}},
+    {'name': 'morning_peak', 'hours': [[8, 11]],
+     'factors': {'motorway': 0.7, 'trunk': 0.5, 'primary': 0.45,
+                 'secondary': 0.5, 'tertiary': 0.55, 'default': 0.65}},
+    {'name': 'midday', 'hours': [[11, 17]],
+     'factors': {'motorway': 0.85, 'default': 0.7}},
+    {'name': 'evening_peak', 'hours': [[17, 21]],
+     'factors': {'motorway': 0.65, 'trunk': 0.45, 'primary': 0.4,
+                 'secondary': 0.45, 'tertiary': 0.5, 'default': 0.6}},
+    {'name': 'late_evening', 'hours': [[21, 22]],
+     'factors': {'default': 0.8}},
+]
+
+MINUTES_PER_DAY = 24 * 60
+
+
+def load_profiles(path):
+    """Read speed profiles from a JSON file shaped like PROFILES"""
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def highway_code(value):
+    """Class code of an edge's ``highway`` tag (OSMnx may give a list)"""
+    if isinstance(value, list):
+        value = value[0] if value else None
+    return HIGHWAY_CODES.get(value, HIGHWAY_CODES['road'])
+
+
+def parse_maxspeed(value):
+    """Signed speed limit in km/h, or NaN when missing or not numeric"""
+    if value is None:
+        return math.nan
+    values = value if isinstance(value, list) else str(value).split(';')
+    speeds = []
+    for item in values:
+        match = re.match(r'\s*(\d+(?:\.\d+)?)\s*(mph)?', str(item))
+        if match:
+            speed = float(match.group(1))
+            speeds.append(speed * 1.609344 if match.group(2) else speed)
+    return min(speeds) if speeds else math.nan
+
+
+def _factor(factors, name):
+    if name in factors:
+        return factors[name]
+    if name.endswith('_link') and name[:-5] in factors:
+        return factors[name[:-5]]
+    return factors.get('default', 1.0)
+
+
+def profiles_hash(profiles):
+    """Digest of the profiles and the speed table their travel times use"""
+    text = json.dumps([HIGHWAY_CLASSES, FREE_FLOW_KPH, profiles],
+                      sort_keys=True)
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def bucket_minutes(profiles):
+    """Bucket index for every minute of the day"""
+    buckets = np.zeros(MINUTES_PER_DAY, dtype=np.int8)
+    for i, profile in enumerate(profiles):
+        for start, end in profile['hours']:
+            buckets[int(start * 60):int(end * 60)] = i
+    return buckets
+
+
+def travel_times(highway, maxspeed, length, profiles):
+    """Seconds to traverse every edge, one row per profile bucket"""
+    free_flow = np.array([FREE_FLOW_KPH[name] for name in HIGHWAY_CLASSES],
+                         dtype=np.float64)[highway]
+    free_flow = np.fmin(free_flow, maxspeed)
+
+    times = np.empty((len(profiles), len(length)), dtype=np.float32)
+    for i, profile in enumerate(profiles):
+        factors = np.array([_factor(profile['factors'], name)
+                            for name in HIGHWAY_CLASSES])
+        speed_mps = free_flow * factors[highway] / 3.6
+        times[i] = length / speed_mps
+    return times
+
+
+def seconds_of_day(departure=None):
+    """Seconds after local midnight for a datetime, time, number or now"""
+    if departure is None:
+        departure = datetime.now()
+    if isinstance(departure, (datetime, dtime)):
+        return (departure.hour * 3600 + departure.minute * 60
+                + departure.second)
+    return float(departure) % (MINUTES_PER_DAY * 60)
+
+
+def parse_departure(text):
+    """Departure from a query string: ISO datetime, ``HH:MM`` or empty"""
+    if not text:
+        return None
+    if 'T' in text or '-' in text:
+        return datetime.fromisoformat(text)
+    return dtime.fromisoformat(text)
@@ -0,0 +1,226 @@
+import functools
+import math
+import time
+
+import metrics
+from graph import load_compiled
+from partition import PartitionedGraph, partition_path, partition_ready
+from search import one_to_many, shortest_path, route_length, route_duration
+
+# Largest number of stops a single trip may have
+MAX_STOPS = 100
+
+# Smallest change in tour cost that counts as an improvement
+EPSILON = 1e-9
+
+# Graph of a worker process and where it comes from, set by init_worker
+_graph = None
+_partition = None
+_source = None
+
+
+class Unreachable(ValueError):
+    """Some stops of a trip cannot be reached from the others"""
+
+
+def init_worker(graph_path, profiles=None, partitioned=False):
+    """Process-pool initializer: load the compiled graph once per worker.
+
+    Used by RoutingEngine's trip pool and by server.py's search pool. With
+    ``partitioned``, a partition that is ready (see RoutingEngine) is opened
+    instead, and the whole graph is left for worker_graph to load when a
+    job needs it.
+    """
+    global _graph, _partition, _source
+    metrics.reset()
+    _graph = _partition = None
+    _source = (graph_path, profiles)
+    if partitioned and profiles is None and partition_ready(graph_path):
+        _partition = PartitionedGraph(partition_path(graph_path))
+    else:
+        worker_graph()
+
+
+def worker_graph():
+    """The compiled graph of this worker process, loaded on first use"""
+    global _graph
+    if _graph is None:
+        graph_path, profiles = _source
+        _graph = load_compiled(graph_path)
+        if profiles is not None:
+            _graph.apply_profiles(profiles)
+    return _graph
+
+
+def worker_partition():
+    """The partition init_worker opened in this process, or None"""
+    return _partition
+
+
+def _pool_map(executor, fn, jobs):
+    """executor.map, counting the metrics the workers record in this process"""
+    results = []
+    for result, recorded in executor.map(
+            functools.partial(metrics.measured, metrics.enabled, fn), jobs):
+        metrics.merge(recorded)
+        results.append(result)
+    return results
+
+
+def _matrix_row(args):
+    return one_to_many(worker_graph(), *args)
+
+
+def _leg(args):
+    source, target, weight, departure = args
+    return shortest_path(worker_graph(), source, target, weight=weight,
+                         departure=departure)
+
+
+def solve_order(matrix, roundtrip=False, time_budget=1.0):
+    """Visiting order of the stops in a cost matrix, starting at stop 0.
+
+    Builds a nearest-neighbour tour and improves it with 2-opt and Or-opt
+    moves until neither helps or ``time_budget`` seconds have passed. The
+    matrix may be asymmetric. Without ``roundtrip`` the tour may end at any
+    stop: a dummy stop is added that every stop reaches for free and that
+    only leads to stop 0, and it is dropped from the result.
+    """
+    n = len(matrix)
+    if n <= 2:
+        return list(range(n))
+
+    finite = [c for row in matrix for c in row if c != math.inf]
+    big = (max(finite, default=0.0) + 1.0) * n * 10
+    cost = [[big if c == math.inf else c for c in row] for row in matrix]
+    if not roundtrip:
+        for row in cost:
+            row.append(0.0)
+        cost.append([0.0] + [big] * (n - 1) + [0.0])
+
+    tour = _nearest_neighbour(cost, n if not roundtrip else 0)
+    deadline = time.perf_counter() + time_budget
+    while time.perf_counter() < deadline:
+        if not (_two_opt(cost, tour, deadline) or _or_opt(cost, tour, deadline)):
+            break
+    return tour if roundtrip else tour[1:]
+
+
+def tour_cost(matrix, order, roundtrip=False):
+    stops = order + order[:1] if roundtrip else order
+    return sum(matrix[a][b] for a, b in zip(stops, stops[1:]))
+
+
+def _nearest_neighbour(cost, start):
+    tour = [start]
+    unvisited = set(range(len(cost))) - {start}
+    while unvisited:
+        row = cost[tour[-1]]
+        nearest = min(unvisited, key=row.__getitem__)
+        unvisited.remove(nearest)
+        tour.append(nearest)
+    return tour
+
+
+def _two_opt(cost, tour, deadline):
+    """Apply the first improving segment reversal found; True if one was"""
+    t = tour + tour[:1]
+    n = len(tour)
+    # Prefix sums of the path cost walked forwards and backwards, so the
+    # cost of a reversed segment in an asymmetric matrix is O(1)
+    forward, backward = [0.0], [0.0]
+    for a, b in zip(t, t[1:]):
+        forward.append(forward[-1] + cost[a][b])
+        backward.append(backward[-1] + cost[b][a])
+
+    for i in range(1, n - 1):
+        if time.perf_counter() > deadline:
+            return False
+        a, ti = t[i - 1], t[i]
+        for j in range(i + 1, n):
+            tj, b = t[j], t[j + 1]
+            delta = (cost[a][tj] + cost[ti][b] - cost[a][ti] - cost[tj][b]
+                     + backward[j] - backward[i] - forward[j] + forward[i])
+            if delta < -EPSILON:
+                tour[i:j + 1] = tour[i:j + 1][::-1]
+                return True
+    return False
+
+
+def _or_opt(cost, tour, deadline):
+    """Apply the first improving move of a 1-3 stop segment; True if one was"""
+    t = tour + tour[:1]
+    n = len(tour)
+    for length in (1, 2, 3):
+        for i in range(1, n - length + 1):
+            if time.perf_counter() > deadline:
+                return False
+            prev, first = t[i - 1], t[i]
+            last, nxt = t[i + length - 1], t[i + length]
+            removed = cost[prev][first] + cost[last][nxt] - cost[prev][nxt]
+            for p in range(n):
+                if i - 1 <= p <= i + length - 1:
+                    continue
+                a, b = t[p], t[p + 1]
+                added = cost[a][first] + cost[last][b] - cost[a][b]
+                if added - removed < -EPSILON:
+                    segment = tour[i:i + length]
+                    rest = tour[:i] + tour[i + length:]
+                    at = p + 1 if p < i else p + 1 - length
+                    tour[:] = rest[:at] + segment + rest[at:]
+                    return True
+    return False
+
+
+@metrics.timed('trip')
+def plan_trip(graph, stops, weight='length', departure=0.0, roundtrip=False,
+              time_budget=1.0, executor=None):
+    """Best visiting order for node positions ``stops`` and its legs.
+
+    The cost matrix comes from one one-to-many search per stop. Those
+    searches and the final leg searches run on ``executor`` (a process
+    pool set up with ``init_worker``) when one is given. Leg departures
+    for time-dependent routing are estimated from the matrix. Returns
+    ``(order, legs)`` with ``legs`` a list of search.Route.
+    """
+    if len(stops) > MAX_STOPS:
+        raise ValueError(f"A trip can have at most {MAX_STOPS} stops")
+
+    if executor is not None:
+        rows = _pool_map(executor, _matrix_row,
+                         [(s, stops, weight, departure) for s in stops])
+    else:
+        rows = [one_to_many(graph, s, stops, weight, departure) for s in stops]
+
+    order = solve_order(rows, roundtrip, time_budget)
+    if tour_cost(rows, order, roundtrip) == math.inf:
+        raise Unreachable("Some stops cannot be reached from the others")
+
+    visits = order + order[:1] if roundtrip else order
+    leg_args = []
+    elapsed = 0.0
+    for a, b in zip(visits, visits[1:]):
+        leg_args.append((stops[a], stops[b], weight, departure + elapsed))
+        if weight == 'travel_time':
+            elapsed += rows[a][b]
+
+    if executor is not None:
+        legs = _pool_map(executor, _leg, leg_args)
+    else:
+        legs = [shortest_path(graph, s, t, weight=w, departure=d)
+                for s, t, w, d in leg_args]
+    return order, legs
+
+
+def leg_summaries(graph, order, legs, roundtrip=False, departure=0.0):
+    """Distance and duration of each leg, departing when the last one ends"""
+    visits = order + order[:1] if roundtrip else order
+    summaries = []
+    clock = departure
+    for a, b, route in zip(visits, visits[1:], legs):
+        duration = route_duration(graph, route, clock)
+        summaries.append({'from': a, 'to': b,
+                          'distance': route_length(graph, route),
+                          'duration': duration})
+        clock += duration
+    return summaries
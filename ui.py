@@ -1,267 +1,330 @@
-# File: main.py
-import sys
-import os
-from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
-                            QHBoxLayout, QLineEdit, QPushButton, QLabel, QMessageBox)
-from PyQt5.QtWebEngineWidgets import QWebEngineView
-from PyQt5.QtCore import QUrl
-import folium
-import sqlite3
-import osmnx as ox
-import networkx as nx
-from pathlib import Path
-import json
-import pickle
-import base64
-
-class OfflineMapsApp(QMainWindow):
-    def __init__(self):
-        super().__init__()
-        self.setWindowTitle("Offline Maps")
-        self.setGeometry(100, 100, 800, 600)
-        
-        # Check if offline data exists
-        if not self.check_offline_data():
-            QMessageBox.critical(self, "Error", 
-                               "Offline data not found. Please run setup_offline_data.py first.")
-            sys.exit(1)
-        
-        # Initialize offline data
-        self.load_offline_data()
-        
-        # Create main widget and layout
-        main_widget = QWidget()
-        self.setCentralWidget(main_widget)
-        layout = QVBoxLayout()
-        
-        # Create search bar and buttons
-        search_layout = QHBoxLayout()
-        
-        self.search_bar = QLineEdit()
-        self.search_bar.setPlaceholderText("Enter location to search...")
-        search_button = QPushButton("Search")
-        search_button.clicked.connect(self.search_location)
-        
-        search_layout.addWidget(self.search_bar)
-        search_layout.addWidget(search_button)
-        
-        # Route planning widgets
-        route_layout = QHBoxLayout()
-        
-        self.source_input = QLineEdit()
-        self.source_input.setPlaceholderText("Enter source location...")
-        
-        self.dest_input = QLineEdit()
-        self.dest_input.setPlaceholderText("Enter destination...")
-        
-        route_button = QPushButton("Show Route")
-        route_button.clicked.connect(self.show_route)
-        
-        route_layout.addWidget(QLabel("From:"))
-        route_layout.addWidget(self.source_input)
-        route_layout.addWidget(QLabel("To:"))
-        route_layout.addWidget(self.dest_input)
-        route_layout.addWidget(route_button)
-        
-        # Create map view
-        self.map_view = QWebEngineView()
-        
-        # Add widgets to main layout
-        layout.addLayout(search_layout)
-        layout.addLayout(route_layout)
-        layout.addWidget(self.map_view)
-        
-        main_widget.setLayout(layout)
-        
-        # Initialize map
-        self.initialize_map()
-
-    def check_offline_data(self):
-        """Check if required offline data exists"""
-        required_files = [
-            'offline_data/road_network.pkl',
-            'offline_data/geocoding.json'
-        ]
-        return all(Path(f).exists() for f in required_files) and Path('offline_data/tiles').exists()
-
-    def load_offline_data(self):
-        """Load offline data"""
-        try:
-            # Load road network
-            with open('offline_data/road_network.pkl', 'rb') as f:
-                self.G = pickle.load(f)
-            
-            # Load geocoding database
-            with open('offline_data/geocoding.json', 'r') as f:
-                self.geocoding_db = json.load(f)
-                
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"Failed to load offline data: {str(e)}")
-            sys.exit(1)
-
-    def create_map_html(self, center_lat, center_lon, zoom=12, markers=None, route=None):
-        """Create HTML for the map with embedded tile data"""
-        html = f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <link rel="stylesheet" href="https://unpkg.com/leaflet@1.7.1/dist/leaflet.css"/>
-            <script src="https://unpkg.com/leaflet@1.7.1/dist/leaflet.js"></script>
-            <style>
-                #map {{ height: 100vh; width: 100%; }}
-            </style>
-        </head>
-        <body>
-            <div id="map"></div>
-            <script>
-                var map = L.map('map').setView([{center_lat}, {center_lon}], {zoom});
-                
-                // Add tile layer using local tiles
-                L.tileLayer('file://{str(Path("offline_data/tiles").absolute())}/{{z}}/{{x}}/{{y}}.png', {{
-                    minZoom: 10,
-                    maxZoom: 15,
-                    attribution: '© OpenStreetMap contributors'
-                }}).addTo(map);
-        """
-        
-        # Add markers if provided
-        if markers:
-            for marker in markers:
-                html += f"""
-                L.marker([{marker['lat']}, {marker['lon']}])
-                    .bindPopup('{marker['popup']}')
-                    .addTo(map);
-                """
-        
-        # Add route if provided
-        if route:
-            html += f"""
-            L.polyline({route},
-                {{color: 'blue', weight: 2, opacity: 0.8}}).addTo(map);
-            """
-        
-        html += """
-            </script>
-        </body>
-        </html>
-        """
-        
-        # Save to temporary file
-        temp_path = Path('temp_map.html')
-        with open(temp_path, 'w') as f:
-            f.write(html)
-        return temp_path
-
-    def initialize_map(self):
-        """Initialize the map"""
-        try:
-            initial_location = self.geocoding_db[0]
-            temp_path = self.create_map_html(
-                initial_location['latitude'],
-                initial_location['longitude']
-            )
-            self.map_view.setUrl(QUrl.fromLocalFile(str(temp_path.absolute())))
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"Failed to initialize map: {str(e)}")
-
-    def find_location(self, search_text):
-        """Find location in offline database"""
-        search_text_lower = search_text.lower()
-        for entry in self.geocoding_db:
-            if search_text_lower in entry['name'].lower():
-                return entry['latitude'], entry['longitude']
-        return None, None
-
-    def search_location(self):
-        """Search for a location"""
-        search_text = self.search_bar.text()
-        
-        latitude, longitude = self.find_location(search_text)
-        
-        if latitude is None or longitude is None:
-            QMessageBox.warning(self, "Not Found", 
-                              "Location not found in offline database")
-            return
-        
-        # Create marker
-        markers = [{
-            'lat': latitude,
-            'lon': longitude,
-            'popup': search_text
-        }]
-        
-        # Update map
-        temp_path = self.create_map_html(
-            latitude, longitude,
-            zoom=14,
-            markers=markers
-        )
-        self.map_view.setUrl(QUrl.fromLocalFile(str(temp_path.absolute())))
-
-    def show_route(self):
-        """Show route between two locations"""
-        source = self.source_input.text()
-        destination = self.dest_input.text()
-        
-        try:
-            # Get coordinates
-            source_lat, source_lon = self.find_location(source)
-            dest_lat, dest_lon = self.find_location(destination)
-            
-            if None in (source_lat, source_lon, dest_lat, dest_lon):
-                QMessageBox.warning(self, "Not Found", 
-                                  "One or both locations not found in offline database")
-                return
-            
-            # Calculate center point
-            center_lat = (source_lat + dest_lat) / 2
-            center_lon = (source_lon + dest_lon) / 2
-            
-            # Create markers
-            markers = [
-                {
-                    'lat': source_lat,
-                    'lon': source_lon,
-                    'popup': source
-                },
-                {
-                    'lat': dest_lat,
-                    'lon': dest_lon,
-                    'popup': destination
-                }
-            ]
-            
-            # Find route
-            source_node = ox.nearest_nodes(self.G, source_lon, source_lat)
-            dest_node = ox.nearest_nodes(self.G, dest_lon, dest_lat)
-            
-            try:
-                route = nx.shortest_path(self.G, source_node, dest_node, weight='length')
-                
-                # Get route coordinates
-                route_coords = []
-                for node in route:
-                    route_coords.append([self.G.nodes[node]['y'], self.G.nodes[node]['x']])
-                
-                # Update map
-                temp_path = self.create_map_html(
-                    center_lat, center_lon,
-                    zoom=12,
-                    markers=markers,
-                    route=route_coords
-                )
-                self.map_view.setUrl(QUrl.fromLocalFile(str(temp_path.absolute())))
-                
-            except nx.NetworkXNoPath:
-                QMessageBox.warning(self, "No Route", 
-                                  "No route found between these locations")
-                return
-            
-        except Exception as e:
-            QMessageBox.warning(self, "Error", f"Error showing route: {str(e)}")
-
-if __name__ == '__main__':
-    app = QApplication(sys.argv)
-    window = OfflineMapsApp()
-    window.show()
+# File: main.py
+import sys
+import os
+from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
+                            QHBoxLayout, QLineEdit, QPushButton, QLabel, QMessageBox,
+                            QProgressBar)
+from PyQt5.QtWebEngineWidgets import QWebEngineView
+from PyQt5.QtCore import QUrl, pyqtSignal
+from pathlib import Path
+import json
+from graph import load_compiled
+from search import shortest_path
+from workers import RouteWorkerPool, StagedLoader
+
+class OfflineMapsApp(QMainWindow):
+    # Emitted once every startup stage has loaded
+    data_ready = pyqtSignal()
+    
+    def __init__(self):
+        super().__init__()
+        self.setWindowTitle("Offline Maps")
+        self.setGeometry(100, 100, 800, 600)
+        
+        # Check if offline data exists
+        if not self.check_offline_data():
+            QMessageBox.critical(self, "Error", 
+                               "Offline data not found. Please run setup_offline_data.py first.")
+            sys.exit(1)
+        
+        # Offline data is filled in by the startup loader
+        self.geocoding_db = None
+        self.compiled = None
+        
+        # Create main widget and layout
+        main_widget = QWidget()
+        self.setCentralWidget(main_widget)
+        layout = QVBoxLayout()
+        
+        # Create search bar and buttons
+        search_layout = QHBoxLayout()
+        
+        self.search_bar = QLineEdit()
+        self.search_bar.setPlaceholderText("Enter location to search...")
+        self.search_button = QPushButton("Search")
+        self.search_button.clicked.connect(self.search_location)
+        self.search_button.setEnabled(False)
+        
+        search_layout.addWidget(self.search_bar)
+        search_layout.addWidget(self.search_button)
+        
+        # Route planning widgets
+        route_layout = QHBoxLayout()
+        
+        self.source_input = QLineEdit()
+        self.source_input.setPlaceholderText("Enter source location...")
+        
+        self.dest_input = QLineEdit()
+        self.dest_input.setPlaceholderText("Enter destination...")
+        
+        self.route_button = QPushButton("Show Route")
+        self.route_button.clicked.connect(self.show_route)
+        self.route_button.setEnabled(False)
+        
+        route_layout.addWidget(QLabel("From:"))
+        route_layout.addWidget(self.source_input)
+        route_layout.addWidget(QLabel("To:"))
+        route_layout.addWidget(self.dest_input)
+        route_layout.addWidget(self.route_button)
+        
+        # Routing runs on a worker; editing an input drops the pending route
+        self.route_workers = RouteWorkerPool(parent=self)
+        self.route_workers.progress.connect(self.on_route_progress)
+        self.route_workers.finished.connect(self.on_route_finished)
+        self.route_workers.failed.connect(self.on_route_failed)
+        self.source_input.textEdited.connect(self.cancel_route)
+        self.dest_input.textEdited.connect(self.cancel_route)
+        
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setVisible(False)
+        
+        # Create map view
+        self.map_view = QWebEngineView()
+        
+        # Add widgets to main layout
+        layout.addLayout(search_layout)
+        layout.addLayout(route_layout)
+        layout.addWidget(self.progress_bar)
+        layout.addWidget(self.map_view)
+        
+        main_widget.setLayout(layout)
+        
+        # Load data in the background; the map is drawn once the
+        # geocoder is in and routing is enabled once the network is
+        self.loader = StagedLoader([
+            ('geocoder', self.load_geocoder),
+            ('network', self.load_network),
+        ], parent=self)
+        self.loader.stage_ready.connect(self.on_stage_ready)
+        self.loader.stage_failed.connect(self.on_stage_failed)
+        self.loader.finished.connect(self.on_data_loaded)
+        self.loader.start()
+
+    def check_offline_data(self):
+        """Check if required offline data exists"""
+        required_files = [
+            'offline_data/road_network.pkl',
+            'offline_data/geocoding.json'
+        ]
+        return all(Path(f).exists() for f in required_files) and Path('offline_data/tiles').exists()
+
+    def load_geocoder(self):
+        """Load geocoding database"""
+        with open('offline_data/geocoding.json', 'r') as f:
+            return json.load(f)
+
+    def load_network(self):
+        """Load road network arrays; the pickle is only read to rebuild them"""
+        return load_compiled('offline_data/road_network.pkl')
+
+    def on_stage_ready(self, name, value):
+        if name == 'geocoder':
+            self.geocoding_db = value
+            self.search_button.setEnabled(True)
+            self.initialize_map()
+        elif name == 'network':
+            self.compiled = value
+            self.route_button.setEnabled(True)
+
+    def on_stage_failed(self, name, message):
+        QMessageBox.critical(self, "Error", f"Failed to load offline data: {message}")
+
+    def on_data_loaded(self, ok):
+        if ok:
+            self.data_ready.emit()
+
+    def create_map_html(self, center_lat, center_lon, zoom=12, markers=None, route=None):
+        """Create HTML for the map with embedded tile data"""
+        html = f"""
+        <!DOCTYPE html>
+        <html>
+        <head>
+            <link rel="stylesheet" href="https://unpkg.com/leaflet@1.7.1/dist/leaflet.css"/>
+            <script src="https://unpkg.com/leaflet@1.7.1/dist/leaflet.js"></script>
+            <style>
+                #map {{ height: 100vh; width: 100%; }}
+            </style>
+        </head>
+        <body>
+            <div id="map"></div>
+            <script>
+                var map = L.map('map').setView([{center_lat}, {center_lon}], {zoom});
+                
+                // Add tile layer using local tiles
+                L.tileLayer('file://{str(Path("offline_data/tiles").absolute())}/{{z}}/{{x}}/{{y}}.png', {{
+                    minZoom: 10,
+                    maxZoom: 15,
+                    attribution: '© OpenStreetMap contributors'
+                }}).addTo(map);
+        """
+        
+        # Add markers if provided
+        if markers:
+            for marker in markers:
+                html += f"""
+                L.marker([{marker['lat']}, {marker['lon']}])
+                    .bindPopup('{marker['popup']}')
+                    .addTo(map);
+                """
+        
+        # Add route if provided
+        if route:
+            html += f"""
+            L.polyline({route},
+                {{color: 'blue', weight: 2, opacity: 0.8}}).addTo(map);
+            """
+        
+        html += """
+            </script>
+        </body>
+        </html>
+        """
+        
+        # Save to temporary file
+        temp_path = Path('temp_map.html')
+        with open(temp_path, 'w') as f:
+            f.write(html)
+        return temp_path
+
+    def initialize_map(self):
+        """Initialize the map"""
+        try:
+            initial_location = self.geocoding_db[0]
+            temp_path = self.create_map_html(
+                initial_location['latitude'],
+                initial_location['longitude']
+            )
+            self.map_view.setUrl(QUrl.fromLocalFile(str(temp_path.absolute())))
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"Failed to initialize map: {str(e)}")
+
+    def find_location(self, search_text):
+        """Find location in offline database"""
+        search_text_lower = search_text.lower()
+        for entry in self.geocoding_db:
+            if search_text_lower in entry['name'].lower():
+                return entry['latitude'], entry['longitude']
+        return None, None
+
+    def search_location(self):
+        """Search for a location"""
+        search_text = self.search_bar.text()
+        
+        latitude, longitude = self.find_location(search_text)
+        
+        if latitude is None or longitude is None:
+            QMessageBox.warning(self, "Not Found", 
+                              "Location not found in offline database")
+            return
+        
+        # Create marker
+        markers = [{
+            'lat': latitude,
+            'lon': longitude,
+            'popup': search_text
+        }]
+        
+        # Update map
+        temp_path = self.create_map_html(
+            latitude, longitude,
+            zoom=14,
+            markers=markers
+        )
+        self.map_view.setUrl(QUrl.fromLocalFile(str(temp_path.absolute())))
+
+    def show_route(self):
+        """Show route between two locations"""
+        source = self.source_input.text()
+        destination = self.dest_input.text()
+        
+        # Get coordinates
+        source_lat, source_lon = self.find_location(source)
+        dest_lat, dest_lon = self.find_location(destination)
+        
+        if None in (source_lat, source_lon, dest_lat, dest_lon):
+            QMessageBox.warning(self, "Not Found", 
+                              "One or both locations not found in offline database")
+            return
+        
+        compiled = self.compiled
+        
+        # Runs on the worker thread; every report() is a cancellation point
+        def job(report):
+            report(0, "Snapping to roads")
+            source_node = compiled.nearest(source_lat, source_lon)
+            dest_node = compiled.nearest(dest_lat, dest_lon)
+            
+            report(10, "Finding route")
+            route = shortest_path(
+                compiled, source_node, dest_node,
+                callback=lambda done: report(10 + 85 * done, "Finding route")
+            )
+            if route is None:
+                return None
+            return compiled.search_geometry(route).tolist()
+        
+        self.pending_route = (source, source_lat, source_lon,
+                              destination, dest_lat, dest_lon)
+        self.progress_bar.setValue(0)
+        self.progress_bar.setVisible(True)
+        self.route_workers.submit(job)
+
+    def cancel_route(self):
+        if self.route_workers.busy:
+            self.route_workers.cancel()
+            self.progress_bar.setVisible(False)
+
+    def on_route_progress(self, percent, stage):
+        self.progress_bar.setValue(percent)
+        self.progress_bar.setFormat(f"{stage} %p%")
+
+    def on_route_failed(self, message):
+        self.progress_bar.setVisible(False)
+        QMessageBox.warning(self, "Error", f"Error showing route: {message}")
+
+    def on_route_finished(self, route_coords):
+        self.progress_bar.setVisible(False)
+        if route_coords is None:
+            QMessageBox.warning(self, "No Route", 
+                              "No route found between these locations")
+            return
+        
+        source, source_lat, source_lon, destination, dest_lat, dest_lon = self.pending_route
+        
+        # Calculate center point
+        center_lat = (source_lat + dest_lat) / 2
+        center_lon = (source_lon + dest_lon) / 2
+        
+        # Create markers
+        markers = [
+            {
+                'lat': source_lat,
+                'lon': source_lon,
+                'popup': source
+            },
+            {
+                'lat': dest_lat,
+                'lon': dest_lon,
+                'popup': destination
+            }
+        ]
+        
+        # Update map
+        temp_path = self.create_map_html(
+            center_lat, center_lon,
+            zoom=12,
+            markers=markers,
+            route=route_coords
+        )
+        self.map_view.setUrl(QUrl.fromLocalFile(str(temp_path.absolute())))
+
+    def closeEvent(self, event):
+        self.route_workers.shutdown()
+        self.loader.wait()
+        super().closeEvent(event)
+
+if __name__ == '__main__':
+    app = QApplication(sys.argv)
+    window = OfflineMapsApp()
+    window.show()
     sys.exit(app.exec_())
\ No newline at end of file
@@ -0,0 +1,399 @@
+"""Vector tiles of the roads and locations produced by convert.py.
+
+Roads and locations are projected to Web Mercator, cut into the tiles of
+every zoom level, simplified to the detail the zoom can show, and encoded
+as gzipped Mapbox Vector Tiles in an MBTiles file. Tiles are rendered on a
+process pool; the parent process only assigns features to tiles and writes
+the results. Minor roads and point locations are left out of the low
+zooms, where they would not be drawn anyway.
+
+Usage:
+    python vectortiles.py [--roads data/hyderabad_roads.json]
+                          [--locations data/hyderabad_locations.json]
+                          [--minzoom 10] [--maxzoom 16] [--workers 4]
+                          [--output hyderabad_vector.mbtiles]
+"""
+import argparse
+import gzip
+import json
+import math
+import os
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from shapely.geometry import LineString
+from shapely.ops import clip_by_rect
+
+# Tile coordinate range, and the margin kept around each tile so lines
+# crossing its edge are not drawn with a gap
+EXTENT = 4096
+BUFFER = 64
+# Douglas-Peucker tolerance in tile units: half a pixel of a 512px tile
+SIMPLIFY = EXTENT / 1024
+
+MIN_ZOOM = 10
+MAX_ZOOM = 16
+
+# Lowest zoom each road type is drawn at; unknown types from DEFAULT_ROAD_ZOOM
+ROAD_ZOOMS = {
+    'motorway': 6, 'trunk': 6, 'motorway_link': 10, 'trunk_link': 10,
+    'primary': 8, 'primary_link': 11, 'secondary': 10, 'secondary_link': 12,
+    'tertiary': 11, 'tertiary_link': 13,
+}
+DEFAULT_ROAD_ZOOM = 13
+# Areas are labelled from zoom 11, other locations from LOCATION_ZOOM
+AREA_ZOOM = 11
+LOCATION_ZOOM = 14
+
+LAYERS = {
+    'roads': {'name': 'String', 'type': 'String'},
+    'locations': {'name': 'String', 'area': 'String', 'type': 'String'},
+}
+
+# Mapbox Vector Tile geometry types and commands
+POINT = 1
+LINESTRING = 2
+MOVE_TO = 1
+LINE_TO = 2
+
+# Tiles per INSERT batch
+BATCH = 500
+
+
+def mercator(lat, lon):
+    """Web Mercator position of points, as fractions of the world (0..1)"""
+    lat = np.clip(np.asarray(lat, dtype=np.float64), -85.0511, 85.0511)
+    x = (np.asarray(lon, dtype=np.float64) + 180.0) / 360.0
+    y = (1.0 - np.arcsinh(np.tan(np.radians(lat))) / math.pi) / 2.0
+    return np.column_stack((x, y))
+
+
+def chain_roads(roads):
+    """Join convert.py's two-point segments back into polylines.
+
+    convert.py writes each LineString as consecutive segments, so a segment
+    continues the previous polyline when it starts where that one ended and
+    has the same name and type. Returns ``(points, name, type)`` tuples with
+    points as ``(lat, lon)`` pairs.
+    """
+    lines = []
+    for road in roads:
+        start, end = tuple(road['start']), tuple(road['end'])
+        name, kind = road.get('name') or '', road.get('type') or 'road'
+        last = lines[-1] if lines else None
+        if (last is not None and last[0][-1] == start
+                and last[1] == name and last[2] == kind):
+            last[0].append(end)
+        else:
+            lines.append(([start, end], name, kind))
+    return lines
+
+
+def road_zoom(kind):
+    if isinstance(kind, list):
+        return min(road_zoom(k) for k in kind)
+    return ROAD_ZOOMS.get(kind, DEFAULT_ROAD_ZOOM)
+
+
+def location_zoom(location):
+    return AREA_ZOOM if location.get('type') == 'area' else LOCATION_ZOOM
+
+
+# Features of a worker process, set once by init_worker
+_roads = None
+_locations = None
+
+
+def init_worker(roads, locations):
+    """Process-pool initializer: keep the projected features per worker.
+
+    ``roads`` is a list of ``(points, properties)`` with points an (n, 2)
+    array of Mercator fractions, ``locations`` the same with one point each.
+    """
+    global _roads, _locations
+    _roads = roads
+    _locations = locations
+
+
+def _varint(value, out):
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _zigzag(value):
+    return value << 1 if value >= 0 else (-value << 1) - 1
+
+
+def _message(number, payload, out):
+    """Length-delimited field ``number`` holding ``payload``"""
+    _varint(number << 3 | 2, out)
+    _varint(len(payload), out)
+    out += payload
+
+
+def _packed(number, values, out):
+    body = bytearray()
+    for value in values:
+        _varint(value, body)
+    _message(number, body, out)
+
+
+def _geometry(parts):
+    """Command integers of a point or line parts given as integer arrays"""
+    commands = []
+    cx = cy = 0
+    for part in parts:
+        commands.append(MOVE_TO | 1 << 3)
+        for i, (x, y) in enumerate(part.tolist()):
+            if i == 1:
+                commands.append(LINE_TO | (len(part) - 1) << 3)
+            commands += (_zigzag(x - cx), _zigzag(y - cy))
+            cx, cy = x, y
+    return commands
+
+
+def encode_layer(name, features):
+    """One MVT layer from ``(geometry type, parts, properties)`` features"""
+    keys, values = {}, {}
+    layer = bytearray()
+    _varint(15 << 3, layer)  # version
+    _varint(2, layer)
+    _message(1, name.encode(), layer)
+    for feature_id, (kind, parts, properties) in enumerate(features, 1):
+        tags = []
+        for key, value in properties.items():
+            if value in ('', None):
+                continue
+            tags.append(keys.setdefault(key, len(keys)))
+            tags.append(values.setdefault(str(value), len(values)))
+        feature = bytearray()
+        _varint(1 << 3, feature)
+        _varint(feature_id, feature)
+        _packed(2, tags, feature)
+        _varint(3 << 3, feature)
+        _varint(kind, feature)
+        _packed(4, _geometry(parts), feature)
+        _message(2, feature, layer)
+    for key in keys:
+        _message(3, key.encode(), layer)
+    for value in values:
+        string = bytearray()
+        _message(1, value.encode(), string)
+        _message(4, string, layer)
+    _varint(5 << 3, layer)
+    _varint(EXTENT, layer)
+    return layer
+
+
+def encode_tile(layers):
+    """Protocol-buffer bytes of a tile from ``{layer name: features}``"""
+    tile = bytearray()
+    for name, features in layers.items():
+        if features:
+            _message(3, encode_layer(name, features), tile)
+    return bytes(tile)
+
+
+def _line_parts(points, scale, x, y):
+    """Integer line parts of a projected line clipped to tile (x, y)"""
+    local = (points * scale - (x, y)) * EXTENT
+    clipped = clip_by_rect(LineString(local), -BUFFER, -BUFFER,
+                           EXTENT + BUFFER, EXTENT + BUFFER)
+    if clipped.is_empty:
+        return []
+    clipped = clipped.simplify(SIMPLIFY, preserve_topology=False)
+    parts = []
+    for line in getattr(clipped, 'geoms', [clipped]):
+        if line.geom_type != 'LineString':
+            continue
+        coords = np.rint(np.asarray(line.coords)).astype(np.int64)
+        # Drop points that round onto the previous one
+        keep = np.ones(len(coords), dtype=bool)
+        keep[1:] = np.any(coords[1:] != coords[:-1], axis=1)
+        coords = coords[keep]
+        if len(coords) >= 2:
+            parts.append(coords)
+    return parts
+
+
+def render_tile(job):
+    """Gzipped tile data for ``(zoom, x, y, road ids, location ids)``"""
+    zoom, x, y, road_ids, location_ids = job
+    scale = 1 << zoom
+    roads = []
+    for i in road_ids:
+        points, properties = _roads[i]
+        parts = _line_parts(points, scale, x, y)
+        if parts:
+            roads.append((LINESTRING, parts, properties))
+    locations = []
+    for i in location_ids:
+        point, properties = _locations[i]
+        local = np.rint((point * scale - (x, y)) * EXTENT).astype(np.int64)
+        if np.all((local >= 0) & (local < EXTENT)):
+            locations.append((POINT, [local[np.newaxis]], properties))
+    if not roads and not locations:
+        return zoom, x, y, None
+    data = encode_tile({'roads': roads, 'locations': locations})
+    return zoom, x, y, gzip.compress(data, 6)
+
+
+def _tile_jobs(roads, road_zooms, locations, location_zooms, zoom):
+    """Render jobs of a zoom: every tile touched by a feature drawn there"""
+    scale = 1 << zoom
+    pad = BUFFER / EXTENT
+    tiles = {}
+    for i, (points, _) in enumerate(roads):
+        if road_zooms[i] > zoom:
+            continue
+        low = np.floor(points.min(axis=0) * scale - pad).astype(int)
+        high = np.floor(points.max(axis=0) * scale + pad).astype(int)
+        for x in range(max(low[0], 0), min(high[0], scale - 1) + 1):
+            for y in range(max(low[1], 0), min(high[1], scale - 1) + 1):
+                tiles.setdefault((x, y), ([], []))[0].append(i)
+    for i, (point, _) in enumerate(locations):
+        if location_zooms[i] > zoom:
+            continue
+        x, y = (point * scale).astype(int).tolist()
+        tiles.setdefault((x, y), ([], []))[1].append(i)
+    return [(zoom, x, y, road_ids, location_ids)
+            for (x, y), (road_ids, location_ids) in sorted(tiles.items())]
+
+
+def _create_mbtiles(path):
+    if os.path.exists(path):
+        os.remove(path)
+    conn = sqlite3.connect(path)
+    conn.executescript('''
+        CREATE TABLE metadata (name TEXT, value TEXT);
+        CREATE UNIQUE INDEX name ON metadata (name);
+        CREATE TABLE tiles (
+            zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER,
+            tile_data BLOB);
+        CREATE UNIQUE INDEX tile_index
+            ON tiles (zoom_level, tile_column, tile_row);
+    ''')
+    return conn
+
+
+def build_vector_tiles(roads, locations, path, minzoom=MIN_ZOOM,
+                       maxzoom=MAX_ZOOM, workers=None):
+    """Write vector tiles of convert.py's roads and locations to ``path``.
+
+    ``roads`` and ``locations`` are the lists convert_hyderabad_geojson
+    returns (or the JSON files it writes). Returns the number of tiles and
+    their total size in bytes.
+    """
+    workers = workers or os.cpu_count() or 1
+    lines = chain_roads(roads)
+    projected_roads = [
+        (mercator([p[0] for p in points], [p[1] for p in points]),
+         {'name': name, 'type': kind if isinstance(kind, str)
+          else ';'.join(kind)})
+        for points, name, kind in lines]
+    projected_locations = [
+        (mercator([loc['lat']], [loc['lng']])[0],
+         {'name': loc.get('name', ''), 'area': loc.get('area', ''),
+          'type': loc.get('type', '')})
+        for loc in locations]
+    road_zooms = [road_zoom(kind) for _, _, kind in lines]
+    location_zooms = [location_zoom(loc) for loc in locations]
+    jobs = [job for zoom in range(minzoom, maxzoom + 1)
+            for job in _tile_jobs(projected_roads, road_zooms,
+                                  projected_locations, location_zooms, zoom)]
+
+    conn = _create_mbtiles(path)
+    count = size = 0
+    batch = []
+
+    def flush():
+        conn.executemany('INSERT INTO tiles VALUES (?, ?, ?, ?)', batch)
+        batch.clear()
+
+    if workers > 1:
+        pool = ProcessPoolExecutor(workers, initializer=init_worker,
+                                   initargs=(projected_roads, projected_locations))
+        results = pool.map(render_tile, jobs,
+                           chunksize=max(1, len(jobs) // (workers * 8)))
+    else:
+        pool = None
+        init_worker(projected_roads, projected_locations)
+        results = map(render_tile, jobs)
+    try:
+        for zoom, x, y, data in results:
+            if data is None:
+                continue
+            # MBTiles rows count from the south (TMS)
+            batch.append((zoom, x, (1 << zoom) - 1 - y, data))
+            count += 1
+            size += len(data)
+            if len(batch) >= BATCH:
+                flush()
+        flush()
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    points = np.array([(p[0], p[1]) for points, _, _ in lines
+                       for p in points]
+                      + [(loc['lat'], loc['lng']) for loc in locations])
+    if len(points):
+        south, west = points.min(axis=0)
+        north, east = points.max(axis=0)
+    else:
+        south = west = north = east = 0.0
+    metadata = {
+        'name': os.path.splitext(os.path.basename(path))[0],
+        'format': 'pbf',
+        'type': 'baselayer',
+        'minzoom': str(minzoom),
+        'maxzoom': str(maxzoom),
+        'bounds': f'{west},{south},{east},{north}',
+        'center': f'{(west + east) / 2},{(south + north) / 2},{minzoom}',
+        'json': json.dumps({'vector_layers': [
+            {'id': layer, 'fields': fields, 'minzoom': minzoom,
+             'maxzoom': maxzoom}
+            for layer, fields in LAYERS.items()]}),
+    }
+    conn.executemany('INSERT INTO metadata VALUES (?, ?)', metadata.items())
+    conn.commit()
+    conn.close()
+    return count, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--roads', default='data/hyderabad_roads.json')
+    parser.add_argument('--locations', default='data/hyderabad_locations.json')
+    parser.add_argument('--minzoom', type=int, default=MIN_ZOOM)
+    parser.add_argument('--maxzoom', type=int, default=MAX_ZOOM)
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--output', default='hyderabad_vector.mbtiles')
+    args = parser.parse_args()
+
+    roads, locations = [], []
+    try:
+        with open(args.roads, encoding='utf-8') as f:
+            roads = json.load(f)['roads']
+    except FileNotFoundError:
+        print(f"Error: Could not find the file {args.roads}")
+    try:
+        with open(args.locations, encoding='utf-8') as f:
+            locations = json.load(f)
+    except FileNotFoundError:
+        print(f"Error: Could not find the file {args.locations}")
+    if not roads and not locations:
+        print("No data available to generate tiles")
+        return
+
+    count, size = build_vector_tiles(roads, locations, args.output,
+                                     args.minzoom, args.maxzoom, args.workers)
+    print(f"Wrote {count} tiles, {size / 2 ** 20:.1f} MB of tile data, "
+          f"to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
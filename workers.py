@@ -0,0 +1,166 @@
+import threading
+import traceback
+
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+
+class RequestCancelled(Exception):
+    """Raised inside a job once its request has been superseded"""
+
+
+class CancelToken:
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def check(self):
+        if self._event.is_set():
+            raise RequestCancelled()
+
+
+class _TaskSignals(QObject):
+    progress = pyqtSignal(int, int, str)
+    finished = pyqtSignal(int, object)
+    failed = pyqtSignal(int, str)
+
+
+class _Task(QRunnable):
+    def __init__(self, request_id, job, token, signals):
+        super().__init__()
+        self.request_id = request_id
+        self.job = job
+        self.token = token
+        self.signals = signals
+
+    def report(self, percent, stage=''):
+        """Progress hook handed to the job; also the cancellation point"""
+        self.token.check()
+        self.signals.progress.emit(self.request_id, int(percent), stage)
+
+    def run(self):
+        try:
+            self.token.check()
+            result = self.job(self.report)
+            self.token.check()
+        except RequestCancelled:
+            return
+        except Exception as e:
+            traceback.print_exc()
+            self.signals.failed.emit(self.request_id, str(e))
+            return
+        self.signals.finished.emit(self.request_id, result)
+
+
+class RouteWorkerPool(QObject):
+    """Runs routing jobs off the GUI thread.
+
+    A job is a callable taking a ``report(percent, stage)`` function and
+    returning its result. Only the latest submitted request is live:
+    submitting a new one (or calling ``cancel``) cancels the previous one,
+    and anything a superseded job still emits is dropped. Signals are
+    delivered on the thread that owns the pool, normally the GUI thread.
+    """
+
+    progress = pyqtSignal(int, str)
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(str)
+
+    def __init__(self, max_threads=1, parent=None):
+        super().__init__(parent)
+        # One thread by default: the routing engine and its spatial index
+        # are shared, and a superseded job stops at its next check anyway
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(max_threads)
+        self.signals = _TaskSignals(self)
+        self.signals.progress.connect(self._on_progress)
+        self.signals.finished.connect(self._on_finished)
+        self.signals.failed.connect(self._on_failed)
+        self.request_id = 0
+        self.token = None
+
+    def submit(self, job):
+        self.cancel()
+        self.request_id += 1
+        self.token = CancelToken()
+        self.pool.start(_Task(self.request_id, job, self.token, self.signals))
+        return self.request_id
+
+    def cancel(self):
+        if self.token is not None:
+            self.token.cancel()
+            self.token = None
+        self.pool.clear()
+
+    @property
+    def busy(self):
+        return self.token is not None
+
+    def _on_progress(self, request_id, percent, stage):
+        if request_id == self.request_id and self.token is not None:
+            self.progress.emit(percent, stage)
+
+    def _on_finished(self, request_id, result):
+        if request_id == self.request_id and self.token is not None:
+            self.token = None
+            self.finished.emit(result)
+
+    def _on_failed(self, request_id, message):
+        if request_id == self.request_id and self.token is not None:
+            self.token = None
+            self.failed.emit(message)
+
+    def shutdown(self):
+        self.cancel()
+        self.pool.waitForDone()
+
+
+class _LoaderTask(QRunnable):
+    def __init__(self, loader):
+        super().__init__()
+        self.loader = loader
+
+    def run(self):
+        ok = True
+        for name, load in self.loader.stages:
+            try:
+                value = load()
+            except Exception as e:
+                traceback.print_exc()
+                self.loader.stage_failed.emit(name, str(e))
+                ok = False
+                continue
+            self.loader.stage_ready.emit(name, value)
+        self.loader.finished.emit(ok)
+
+
+class StagedLoader(QObject):
+    """Loads application data in the background, one named stage at a time.
+
+    ``stages`` is a list of ``(name, callable)`` run in order on a worker
+    thread, cheapest first, so the window can show immediately and enable
+    features as their data arrives. ``stage_ready`` carries each stage's
+    return value. A stage that raises emits ``stage_failed`` and the later
+    stages still run; ``finished`` reports whether every stage loaded.
+    """
+
+    stage_ready = pyqtSignal(str, object)
+    stage_failed = pyqtSignal(str, str)
+    finished = pyqtSignal(bool)
+
+    def __init__(self, stages, parent=None):
+        super().__init__(parent)
+        self.stages = list(stages)
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(1)
+
+    def start(self):
+        self.pool.start(_LoaderTask(self))
+
+    def wait(self):
+        self.pool.waitForDone()